@@ -1,5 +1,15 @@
-from player import Player
-from grass import Grass
+from __future__ import annotations
+
+from operator import attrgetter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from player import Player
+    from grass import Grass
+
+# everything of a player, that the viability of an action could depend on,
+# zones are part of it, as versions only count the changes of one zone object
+PLAYER_VERSIONS = attrgetter("hand", "hand.version", "stash", "stash.version", "hassle", "hassle.version", "skips")
 
 
 class Action:
@@ -12,6 +22,7 @@ class Action:
     - drawing a card
     - playing a card
     - showing a card
+    - passing a card left, when paranoia is played
     - giving a card for receiving a card
     - exchanging tabled peddle
     - making an offer
@@ -74,19 +85,20 @@ class DrawCard(Action):
 
 
 class PlayCard(Action):
-    """ playing a card, possible only if we have the card on hand """
-    def __init__(self, player: Player, card_type: str, *args: list):
+    """ playing a card, possible only if we have the card on hand, without a value any card of the type is played """
+    def __init__(self, player: Player, card_type: str, args: list, card_value: int = 0):
         super().__init__(player)
         self.card_type = card_type
+        self.card_value = card_value
         self.args = args
 
     def effect(self, game: Grass):
         super().effect(game)
-        card = self.player.take_hand_card(self.card_type)
+        card = self.player.take_hand_card(self.card_type, self.card_value)
         card.play(*self.args)
 
     def viable(self, game: Grass):
-        return self.player.check_hand_card(self.card_type)
+        return self.player.check_hand_card(self.card_type, self.card_value)
 
 
 class ShowCard(Action):
@@ -102,6 +114,22 @@ class ShowCard(Action):
         return self.player.check_hand_card(self.card_type)
 
 
+class PassCard(Action):
+    """ When paranoia is played, every player passes one hand card to the player on their left """
+    def __init__(self, player: Player, target: Player, card_type: str, card_value: int = 0):
+        super().__init__(player)
+        self.target = target
+        self.card_type = card_type
+        self.card_value = card_value
+
+    def effect(self, game: Grass):
+        super().effect(game)
+        self.target.hand.append(self.player.take_hand_card(self.card_type, self.card_value))
+
+    def viable(self, game: Grass):
+        return self.player.check_hand_card(self.card_type, self.card_value)
+
+
 class CardTrade(Action):
     """ Trading a card for another card requires both players to have a card of the specified type! """
     def __init__(self, player: Player, target: Player, my_card_type: str, your_card_type: str):
@@ -112,8 +140,13 @@ class CardTrade(Action):
 
     def effect(self, game: Grass):
         super().effect(game)
-        self.player.hand.append(self.target.take_hand_card(self.your_card_type))
-        self.target.hand.append(self.player.take_hand_card(self.my_card_type))
+        received = self.target.take_hand_card(self.your_card_type)
+        self.player.hand.append(received)
+        given = self.player.take_hand_card(self.my_card_type)
+        self.target.hand.append(given)
+        # the cards that changed hands, taking a card fills its gap with the last one of the hand,
+        # so observers can't tell them by their position (see Thinking.traded)
+        self.cards = (given, received)
 
     def viable(self, game: Grass):
         return self.player.check_hand_card(self.my_card_type) and self.target.check_hand_card(self.your_card_type)
@@ -150,6 +183,47 @@ class Offer(Action):
         self.actions = actions
         self.threats = threats
         self.target = target
+        # set by the offer book (see offers.py), once the offer is made
+        self.id = -1
+        self.status = None
+        self.kinds = set()
+        # the last viability of the actions, with the versions of everything it was read from
+        self.involved = involved_players(self)
+        self.viable_key = None
+        self.actions_viable = False
+
+    def effect(self, game: Grass):
+        super().effect(game)
+        game.offers.post(self)
+
+    def viable(self, game: Grass):
+        return self.status is None and self.player is not self.target and bool(self.actions)
+
+    def state_key(self, game: Grass) -> tuple:
+        """ versions of all zones and piles the actions of the offer could read """
+        return (len(game.deck), game.waste, game.waste.version, game.waste_status,
+                *map(PLAYER_VERSIONS, self.involved))
+
+    def check_actions(self, game: Grass) -> bool:
+        """ if all actions of the offer are viable, only checked again once anything they read has changed """
+        key = self.state_key(game)
+        if key != self.viable_key:
+            self.viable_key = key
+            self.actions_viable = all(ac.viable(game) for ac in self.actions)
+        return self.actions_viable
+
+
+def involved_players(action: Action) -> list[Player]:
+    """ every player an action and its nested actions act for or on """
+    players = [action.player]
+    target = getattr(action, "target", None)
+    if target is not None and target is not action.player:
+        players.append(target)
+    for nested in [*getattr(action, "actions", ()), *getattr(action, "threats", ())]:
+        for other in involved_players(nested):
+            if other not in players:
+                players.append(other)
+    return players
 
 
 class AgreeOffer(Action):
@@ -165,9 +239,10 @@ class AgreeOffer(Action):
 
     def effect(self, game: Grass):
         super().effect(game)
+        game.offers.agree(self.offer)
 
     def viable(self, game: Grass):
-        return True
+        return self.player is self.offer.target and self.offer.status in ("open", "agreed")
 
 
 class AcceptOffer(Action):
@@ -184,15 +259,13 @@ class AcceptOffer(Action):
 
     def effect(self, game: Grass):
         super().effect(game)
+        game.offers.close(self.offer, "accepted")
         for ac in self.offer.actions:
             game.handle_action(ac)
 
     def viable(self, game: Grass):
-        if self.player is self.offer.target:
-            for ac in self.offer.actions:
-                if not ac.viable(game):
-                    return False
-            return True
+        if self.player is self.offer.target and self.offer.status in ("open", "agreed"):
+            return self.offer.check_actions(game)
         else:
             return False
 
@@ -211,9 +284,10 @@ class RejectOffer(Action):
 
     def effect(self, game: Grass):
         super().effect(game)
+        game.offers.close(self.offer, "rejected")
 
     def viable(self, game: Grass):
-        return self.player is self.offer.target
+        return self.player is self.offer.target and self.offer.status in ("open", "agreed")
 
 
 class RetractOffer(Action):
@@ -228,7 +302,8 @@ class RetractOffer(Action):
 
     def effect(self, game: Grass):
         super().effect(game)
+        game.offers.close(self.offer, "retracted")
 
     def viable(self, game: Grass):
-        return self.player is self.offer.player
+        return self.player is self.offer.player and self.offer.status in ("open", "agreed")
 
@@ -37,16 +37,33 @@ naive_eval = {
 }
 
 
+def concept_name(card) -> str:
+    """ name of a card in the concept value tables, e.g. a Peddle of 25000 is 'Peddle25k' """
+    name = type(card).__name__
+    if name == "MarketClose":
+        return "MarketClosed"
+    if name in ("Peddle", "Protected"):
+        return f"{name}{card.value // 1000}k"
+    return name
+
+
 class Behaviour:
     """
     Anything in here will define the values and behaviour of the player
     It will also be able to offer and accept trades
     """
+    # behaviours that use the beliefs of their player, tables make the knowledge base of their player watch
+    watches = False
+
     def __init__(self):
         self.concept_values = naive_eval
         self.believes = {}
         self.worth = 0
 
+    def choose_play(self, player, game):
+        """ the PlayCard action the player takes after drawing, None leaves it to chance """
+        return None
+
 
 class SimpleMinded(Behaviour):
     def __init__(self):
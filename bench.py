@@ -0,0 +1,177 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from behaviour import Behaviour
+from card import new_deck, get_card
+from evaluation import Greedy
+from grass import Grass
+from legal import action_space
+from player import Player
+from protection import _solve
+
+### Benchmarks:
+# every benchmark returns a dict of metrics, every metric is {"value": ..., "unit": ..., "better": "higher"/"lower"}
+# whole rounds are played on fixed seeds for every table size and policy:
+# - turns/sec and rounds/sec over the whole run, per turn latency percentiles out of every single turn
+# - peak memory of a single round, in a separate run under tracemalloc, which would slow down the timed runs
+# hot paths are timed as the best mean of a few repeats, in microseconds per call
+# baselines are the json output of a run, compare flags every metric that got worse by more than the threshold
+TABLE_SIZES = [2, 6, 10, 30, 100]
+# every policy with the largest table it plays on, Greedy scores every legal play and gets slow on large tables,
+# SimpleMinded plays exactly like Behaviour, so it would only time the same code twice
+POLICIES = {"random": (Behaviour, None), "Greedy": (Greedy, 6)}
+
+
+def metric(value: float, unit: str, better: str) -> dict:
+    return {"value": value, "unit": unit, "better": better}
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def bench_rounds(players: int, policy: str, min_time: float = 1.0, seed: int = 1) -> dict:
+    """ plays rounds on a fresh table until the minimum time is reached, timing every turn """
+    factory = POLICIES[policy][0]
+    game = Grass([Player(f"seat {i}", factory()) for i in range(players)], seed=seed)
+    latencies = []
+    rounds = 0
+    clock = time.perf_counter
+    start = clock()
+    while clock() - start < min_time or not rounds:
+        game.start_round()
+        playing = True
+        while playing:
+            t = clock()
+            playing = game.play_turn()
+            latencies.append(clock() - t)
+        game.score_round()
+        rounds += 1
+    elapsed = clock() - start
+
+    # peak memory of one more round on the same seed, traced on its own
+    game = Grass([Player(f"seat {i}", factory()) for i in range(players)], seed=seed)
+    tracemalloc.start()
+    game.play_round()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rounds_per_sec": metric(rounds / elapsed, "rounds/s", "higher"),
+        "turns_per_sec": metric(len(latencies) / elapsed, "turns/s", "higher"),
+        "turn_p50": metric(percentile(latencies, 0.5) * 1e6, "us", "lower"),
+        "turn_p90": metric(percentile(latencies, 0.9) * 1e6, "us", "lower"),
+        "turn_p99": metric(percentile(latencies, 0.99) * 1e6, "us", "lower"),
+        "peak_memory": metric(peak / 1024, "KiB", "lower"),
+    }
+
+
+def time_call(function, calls: int, repeats: int = 5) -> dict:
+    """ best mean time per call out of a few repeats """
+    best = float("inf")
+    for r in range(repeats):
+        start = time.perf_counter()
+        for i in range(calls):
+            function()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return metric(best * 1e6, "us", "lower")
+
+
+def sample_table(players: int = 6, turns: int = 40, seed: int = 1) -> Grass:
+    """ a table in the middle of a round, with some stashed peddle to work with """
+    game = Grass([Player(f"seat {i}", Behaviour()) for i in range(players)], seed=seed)
+    game.start_round()
+    while game.turn < turns and game.play_turn():
+        pass
+    return game
+
+
+def bench_hot_paths(calls: int = 20000) -> dict:
+    game = sample_table()
+    player = max(game.players, key=lambda pl: len(pl.stash))
+    counts = (3, 2, 1, 0)
+    space = action_space(len(game.players))
+    return {
+        "eval_self": time_call(player.eval_self, calls),
+        "check_stash_for_protection": time_call(lambda: player.check_stash_for_protection(50000), calls),
+        "solve_protection_uncached": time_call(lambda: _solve.__wrapped__(counts, 75000), calls // 10),
+        "new_deck": time_call(new_deck, calls),
+        "get_card": time_call(lambda: get_card("pd", 25000), calls),
+        "grass_clone": time_call(game.clone, calls // 10),
+        "legal_plays": time_call(lambda: space.legal(game, player), calls // 10),
+    }
+
+
+def run(quick: bool = False, sizes: list[int] = None, seed: int = 1) -> dict:
+    min_time = 0.2 if quick else 1.0
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "seed": seed,
+                 "quick": quick, "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "benchmarks": {},
+    }
+    for players in sizes or TABLE_SIZES:
+        for policy, (factory, largest) in POLICIES.items():
+            if largest is not None and players > largest:
+                continue
+            results["benchmarks"][f"rounds/{players}p/{policy}"] = bench_rounds(players, policy, min_time, seed)
+    results["benchmarks"]["hot_paths"] = bench_hot_paths(2000 if quick else 20000)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[str]:
+    """ every metric that got worse than the baseline by more than the threshold, as readable lines """
+    regressions = []
+    for name, metrics in baseline["benchmarks"].items():
+        for key, old in metrics.items():
+            new = current["benchmarks"].get(name, {}).get(key)
+            if new is None or not old["value"]:
+                continue
+            change = (new["value"] - old["value"]) / old["value"]
+            if old["better"] == "higher":
+                change = -change
+            if change > threshold:
+                regressions.append(f"{name} {key}: {old['value']:.4g} -> {new['value']:.4g} {old['unit']} "
+                                   f"({change:+.1%} worse)")
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Grass engine and compare against baselines")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results as json")
+    run_parser.add_argument("--out", default=None, help="file to write the results to, defaults to stdout")
+    run_parser.add_argument("--quick", action="store_true", help="shorter runs, for a rough look")
+    run_parser.add_argument("--players", type=int, nargs="+", default=None, help="table sizes to play")
+    run_parser.add_argument("--seed", type=int, default=1)
+    compare_parser = commands.add_parser("compare", help="flag regressions of a run against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.quick, args.players, args.seed)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for line in regressions:
+        print(line)
+    print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,24 @@
-from grass import Grass
-from player import Player
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from player import Player
 
 
 class Card:
-    """ abstract Card class, make sure every card has type and value """
+    """
+    abstract Card class, make sure every card has type and value
+    Cards never change once created, so there is only one shared instance per card kind (see CARD_KINDS)
+    and decks, hands and piles just hold references to them
+    """
+    __slots__ = ("type", "value", "kind")
 
     def __init__(self):
         self.type = ""
         self.value = 0
+        self.kind = -1
 
     def playable(self, *args):
         pass
@@ -18,6 +29,7 @@ class Card:
 
 class MarketOpen(Card):
     """ open the market as long as you don't already have one """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -25,7 +37,7 @@ class MarketOpen(Card):
 
     @staticmethod
     def playable(player: Player) -> bool:
-        return not ("mo" in [sc.type for sc in player.stash])
+        return not player.check_stash_card("mo")
 
     def play(self, player: Player, game: Grass):
         if self.playable(player=player):
@@ -36,6 +48,7 @@ class MarketOpen(Card):
 
 class MarketClose(Card):
     """ close the market if the own stashed peddle and protected peddle is bigger than 50k and market is not heated """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -44,7 +57,7 @@ class MarketClose(Card):
     @staticmethod
     def playable(player: Player) -> bool:
         current_state = player.eval_self()
-        market_cap = getattr(current_state, "stash") + getattr(current_state, "protected")
+        market_cap = current_state["stash"] + current_state["protected"]
         return not player.heated() and market_cap >= 50000
 
     def play(self, player: Player, game: Grass):
@@ -56,6 +69,7 @@ class MarketClose(Card):
 
 class Peddle(Card):
     """ Play peddle on open non-heated market """
+    __slots__ = ()
 
     def __init__(self, value):
         super().__init__()
@@ -75,6 +89,7 @@ class Peddle(Card):
 
 class HeatOn(Card):
     """ Play Heat on cards however you like as long as someone has an open market """
+    __slots__ = ()
 
     def __init__(self, value):
         super().__init__()
@@ -94,6 +109,7 @@ class HeatOn(Card):
 
 class HeatOff(Card):
     """ Play heat off and pack it on top of your hassle pile, you won't need to worry no more! """
+    __slots__ = ()
 
     def __init__(self, value):
         super().__init__()
@@ -112,6 +128,7 @@ class HeatOff(Card):
 
 class PayFine(Card):
     """ Play heat off and pack it on top of your hassle pile, you won't need to worry no more! """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -131,7 +148,11 @@ class PayFine(Card):
 
 
 class Nirvana(Card):
-    """ Can always play Nirvana cards, but really its only 'played' properly if we already have a market """
+    """
+    Can always play Nirvana cards, but really its only 'played' properly if we already have a market
+    Either way, the player gets another turn right after this one
+    """
+    __slots__ = ()
 
     @staticmethod
     def playable(player: Player) -> bool:
@@ -140,6 +161,7 @@ class Nirvana(Card):
 
 class StoneHigh(Nirvana):
     """ With StoneHigh, we take the lowest stashed peddle card of all our opponents """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -148,18 +170,18 @@ class StoneHigh(Nirvana):
     def play(self, player: Player, game: Grass):
         if self.playable(player=player):
             player.hassle.append(self)
-            for pl in game.players:
+            for pl in game.peddle_stashes():
                 peddle_card = pl.take_lowest_stash_card()
                 if peddle_card:
                     player.stash.append(peddle_card)
-            player.move(game)
         else:
             game.discard(self)
-            player.move(game)
+        game.extra_turn = True
 
 
 class Euphoria(Nirvana):
     """ With Euphoria, we take the highest stashed peddle card of all our opponents """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -168,18 +190,18 @@ class Euphoria(Nirvana):
     def play(self, player: Player, game: Grass):
         if self.playable(player=player):
             player.hassle.append(self)
-            for pl in game.players:
+            for pl in game.peddle_stashes():
                 peddle_card = pl.take_highest_stash_card()
                 if peddle_card:
                     player.stash.append(peddle_card)
-            player.move(game)
         else:
             game.discard(self)
-            player.move(game)
+        game.extra_turn = True
 
 
 class Paranoia(Card):
     """ We can always play paranoia cards, but better opt not to! If so, we send one card left! """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -189,18 +211,13 @@ class Paranoia(Card):
         return True
 
     def play(self, player: Player, game: Grass):
-        # sending cards left
-        sent_card_before = None
-        for pl in game.players:
-            sent_card_after = pl.send_card_left
-            if sent_card_before:
-                pl.hand.append(sent_card_before)
-            sent_card_before = sent_card_after
-        game.players[0].hand.append(sent_card_before)
+        # the game lets everyone send cards left, once this card is dealt with
+        game.passing = True
 
 
 class SoldOut(Paranoia):
     """ loose lowest stashed peddle card and loose 2 turns """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -218,6 +235,7 @@ class SoldOut(Paranoia):
 
 class DoubleCrossed(Paranoia):
     """ loose highest stashed peddle card and loose 2 turns """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -235,6 +253,7 @@ class DoubleCrossed(Paranoia):
 
 class UtterlyWipedOut(Paranoia):
     """ loose everything when played, that is in stash and hassle pile and loose 2 turns """
+    __slots__ = ()
 
     def __init__(self):
         super().__init__()
@@ -253,19 +272,23 @@ class UtterlyWipedOut(Paranoia):
 
 class Protected(Card):
     """ protection will replace peddle cards with protected peddle cards in our stash, its non-reversible """
+    __slots__ = ()
 
     def __init__(self, value):
         super().__init__()
         self.type = "pr"
         self.value = value
 
-    def playable(self, player: Player):
-        return not player.heated() and player.check_stash_for_protection(self.value)
+    def playable(self, player: Player) -> list[int] | None:
+        """ returns the peddle values to protect, if it is playable """
+        if not player.heated():
+            return player.check_stash_for_protection(self.value)
 
     def play(self, player: Player, game: Grass):
-        if self.playable(player):
-            player.stash = [c for i, c in enumerate(player.stash)
-                            if i not in player.check_stash_for_protection(self.value)]
+        protecting = self.playable(player)
+        if protecting:
+            for value in protecting:
+                game.put_aside(player.take_stash_card(value))
             player.stash.append(self)
         else:
             game.discard(self)
@@ -273,8 +296,9 @@ class Protected(Card):
 
 class StealNeighborsPot(Card):
     """ Steal a specific target value from any other player, that is unprotected if our own market isn't heated """
+    __slots__ = ()
 
-    def __int__(self):
+    def __init__(self):
         super().__init__()
         self.type = "sn"
 
@@ -292,8 +316,9 @@ class StealNeighborsPot(Card):
 
 class TheBanker(Card):
     """ Nobody really would want to play this card, if they play it, it will just be discarded """
+    __slots__ = ()
 
-    def __int__(self):
+    def __init__(self):
         super().__init__()
         self.type = "ba"
 
@@ -305,7 +330,8 @@ class TheBanker(Card):
         game.discard(self)
 
 
-def new_deck():
+def build_deck():
+    """ builds a fresh deck of 104 cards, only used once to set up the shared card kinds """
     deck = []
 
     # market open and closed cards
@@ -347,3 +373,28 @@ def new_deck():
     deck.append(TheBanker())
 
     return deck
+
+
+# the 24 different card kinds, one shared flyweight instance each, indexed by their kind
+CARD_KINDS = []
+CARDS = {}
+for c in build_deck():
+    if (c.type, c.value) not in CARDS:
+        c.kind = len(CARD_KINDS)
+        CARD_KINDS.append(c)
+        CARDS[(c.type, c.value)] = c
+
+# a single deck as references to the shared card kinds
+DECK_TEMPLATE = [CARDS[(c.type, c.value)] for c in build_deck()]
+
+
+def get_card(ctype: str, cvalue: int = None) -> Card:
+    """ the shared card instance of a card kind, without a value the first kind of that type """
+    if cvalue is None:
+        return next(c for c in CARD_KINDS if c.type == ctype)
+    return CARDS[(ctype, cvalue)]
+
+
+def new_deck() -> list[Card]:
+    """ a deck of 104 cards, which only copies the references of the precomputed deck """
+    return DECK_TEMPLATE.copy()
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from card import CARD_KINDS, get_card
+from grass import WINNING_SCORE
+from replay import WASTE_STATUSES
+from thinking import Thinking
+
+if TYPE_CHECKING:
+    from grass import Grass
+
+### Observation Encoder:
+# writes what every seat sees of a batch of tables into one float32 buffer of [tables, seats, size], for learning
+# every row is laid out relative to its seat: seat block 0 is the seat itself, then the others in turn order
+# - HAND: counts of every card kind in the own hand
+# - one block of SEAT_SIZE per relative seat:
+#   STASH counts of every kind, HASSLE the top card of the hassle pile one hot (all 0 for an empty pile),
+#   CARDS in hand, SKIPS left, SCORE in units of the winning score, BANKERS the bankers the seat holds as far as
+#   the row's seat knows: its own count for itself, for the others what its Thinking tracks, if it watches the table,
+#   and TURN, 1 for the turn player
+# - the table: the waste top card one hot, waste status one hot over WASTE_STATUSES and the cards left in the deck
+# encoding a batch takes two steps:
+# - gathering copies the counts of zones into raw arrays by absolute seat, but only of the zones that changed since
+#   the last batch, which the zone objects and their versions tell (see Zone.version), so after a turn only a
+#   few zones per table are copied, skips, scores and the waste are read for all tables in one flat list each
+# - assembling fills the buffer from the raw arrays with a few numpy operations over all tables and seats at once,
+#   turning the seats around is a single fancy index
+# the buffer is reused by every batch, copy it to keep observations
+KINDS = len(CARD_KINDS)
+BANKER = get_card("ba").kind
+STASH = slice(0, KINDS)
+HASSLE = slice(KINDS, 2 * KINDS)
+CARDS, SKIPS, SCORE, BANKERS, TURN = range(2 * KINDS, 2 * KINDS + 5)
+SEAT_SIZE = 2 * KINDS + 5
+# one hot rows of every kind, the extra last row stands for no card
+ONE_HOT = np.vstack([np.eye(KINDS, dtype=np.float32), np.zeros((1, KINDS), dtype=np.float32)])
+STATUS_HOT = np.eye(len(WASTE_STATUSES), dtype=np.float32)
+
+
+class ObservationEncoder:
+    """ fixed shape observations of every seat, for batches of up to tables tables with the same number of players """
+
+    def __init__(self, players: int, tables: int):
+        n = players
+        self.players = n
+        self.tables = tables
+        self.hand = slice(0, KINDS)
+        self.seats = slice(KINDS, KINDS + n * SEAT_SIZE)
+        self.waste = slice(self.seats.stop, self.seats.stop + KINDS)
+        self.waste_status = slice(self.waste.stop, self.waste.stop + len(WASTE_STATUSES))
+        self.deck = self.waste_status.stop
+        self.size = self.deck + 1
+        self.buffer = np.zeros((tables, n, self.size), dtype=np.float32)
+        # the seat blocks as [tables, seat, relative seat, SEAT_SIZE], writing to it writes to the buffer
+        self.seat_view = self.buffer[:, :, self.seats].reshape(tables, n, n, SEAT_SIZE)
+        # the absolute seat of every relative seat, as rotation[seat, relative seat]
+        self.rotation = (np.arange(n)[:, None] + np.arange(n)) % n
+        # the raw state by absolute seat
+        self.hands = np.zeros((tables, n, KINDS), dtype=np.float32)
+        self.stashes = np.zeros((tables, n, KINDS), dtype=np.float32)
+        self.hassle_tops = np.full((tables, n), KINDS, dtype=np.intp)
+        self.skips_scores = np.zeros((tables, n, 2), dtype=np.float32)
+        # bankers every seat knows of in the hands of every seat, [tables, seat, seat]
+        self.beliefs = np.zeros((tables, n, n), dtype=np.float32)
+        self.waste_tops = np.full(tables, KINDS, dtype=np.intp)
+        self.statuses = np.zeros(tables, dtype=np.intp)
+        self.decks = np.zeros(tables, dtype=np.float32)
+        self.turns = np.zeros(tables, dtype=np.intp)
+        # the table of every row and the zones copied for it, with their versions, hand, stash and hassle per seat
+        self.games = [None] * tables
+        self.zones = [[None] * (3 * n) for t in range(tables)]
+        self.versions = [[0] * (3 * n) for t in range(tables)]
+
+    def encode(self, games: list[Grass]) -> np.ndarray:
+        """ the observations of every seat of the games, one row of the buffer per game """
+        if len(games) > self.tables:
+            raise ValueError(f"the encoder holds {self.tables} tables, not {len(games)}")
+        m = len(games)
+        self.beliefs[:m] = 0
+        for t, game in enumerate(games):
+            if len(game.players) != self.players:
+                raise ValueError(f"the encoder is for {self.players} players, not {len(game.players)}")
+            self.gather(t, game)
+        # numpy takes flat lists of numbers much faster than nested ones
+        self.skips_scores[:m] = np.array([value for game in games for pl in game.players
+                                          for value in (pl.skips, pl.score)], dtype=np.float32).reshape(m, -1, 2)
+        self.skips_scores[:m, :, 1] /= WINNING_SCORE
+        self.waste_tops[:m] = [top.kind if (top := game.waste.top()) else KINDS for game in games]
+        self.statuses[:m] = [WASTE_STATUSES.index(game.waste_status) for game in games]
+        self.decks[:m] = [len(game.deck) for game in games]
+        self.turns[:m] = [game.turn_player for game in games]
+        self.assemble(m)
+        return self.buffer[:m]
+
+    def gather(self, t: int, game: Grass):
+        """ copies the zones of the table that changed since the row last saw it """
+        zones = self.zones[t]
+        versions = self.versions[t]
+        if game is not self.games[t]:
+            self.games[t] = game
+            zones[:] = [None] * len(zones)
+        for seat, pl in enumerate(game.players):
+            i = 3 * seat
+            zone = pl.hand
+            if zones[i] is not zone or versions[i] != zone.version:
+                zones[i], versions[i] = zone, zone.version
+                self.hands[t, seat] = zone.counts
+            zone = pl.stash
+            if zones[i + 1] is not zone or versions[i + 1] != zone.version:
+                zones[i + 1], versions[i + 1] = zone, zone.version
+                self.stashes[t, seat] = zone.counts
+            zone = pl.hassle
+            if zones[i + 2] is not zone or versions[i + 2] != zone.version:
+                zones[i + 2], versions[i + 2] = zone, zone.version
+                top = zone.top()
+                self.hassle_tops[t, seat] = top.kind if top else KINDS
+        for observer in game.observers:
+            if isinstance(observer, Thinking) and observer.seat >= 0 and len(observer.known) == self.players:
+                self.beliefs[t, observer.seat] = observer.known[:, BANKER]
+
+    def assemble(self, m: int):
+        """ fills the first m rows of the buffer from the raw state """
+        rotation = self.rotation
+        buffer = self.buffer[:m]
+        seats = self.seat_view[:m]
+        buffer[:, :, self.hand] = self.hands[:m]
+        seats[..., STASH] = self.stashes[:m, rotation]
+        seats[..., HASSLE] = ONE_HOT[self.hassle_tops[:m, rotation]]
+        seats[..., CARDS] = self.hands[:m].sum(axis=2)[:, rotation]
+        seats[..., SKIPS:SCORE + 1] = self.skips_scores[:m, rotation]
+        bankers = np.take_along_axis(self.beliefs[:m], rotation[None], axis=2)
+        bankers[:, :, 0] = self.hands[:m, :, BANKER]
+        seats[..., BANKERS] = bankers
+        seats[..., TURN] = rotation == self.turns[:m, None, None]
+        buffer[:, :, self.waste] = ONE_HOT[self.waste_tops[:m]][:, None]
+        buffer[:, :, self.waste_status] = STATUS_HOT[self.statuses[:m]][:, None]
+        buffer[:, :, self.deck] = self.decks[:m, None]
+
+    def layout(self) -> dict[str, slice | int]:
+        """ where everything is in the row of a seat, seat blocks are given for relative seat 0 """
+        start = self.seats.start
+        return {"hand": self.hand, "seats": self.seats, "seat_size": SEAT_SIZE,
+                "stash": slice(start + STASH.start, start + STASH.stop),
+                "hassle": slice(start + HASSLE.start, start + HASSLE.stop),
+                "cards": start + CARDS, "skips": start + SKIPS, "score": start + SCORE,
+                "bankers": start + BANKERS, "turn": start + TURN,
+                "waste": self.waste, "waste_status": self.waste_status, "deck": self.deck}
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
+from action import (Action, Skip, DrawCard, PlayCard, CardTrade, Offer, AgreeOffer, AcceptOffer, RejectOffer,
+                    RetractOffer)
+from grass import WINNING_SCORE, MAX_ROUNDS
+from legal import action_space, DRAW, PLAY
+from player import Player
+from zone import TYPE_KINDS
+
+if TYPE_CHECKING:
+    from grass import Grass
+
+### Async Engine:
+# plays tables with every seat as an agent coroutine, so slow or remote bots never stall anything else:
+# many tables can share one event loop, each one waits on its own agents only
+# every decision sends the agent an observation (see observe) and waits for its answer up to a deadline
+# - draw and play decisions are answered with an index of the action space (see legal.py), local agents
+#   may also answer with an Action of the table, anything illegal or late is replaced by the fallback,
+#   immediate agents (see Agent) are asked right away instead, without an observation or a deadline
+# - before the turn player plays, all seats trade at once: every seat gets to send a list of messages,
+#   all seats are asked concurrently and the messages are applied in seat order, starting with the turn player:
+#   {"offer": {"target": seat, "give": card type, "take": card type}} offers to trade a hand card,
+#   {"accept": id}, {"agree": id}, {"reject": id} answer an offer to the seat, {"retract": id} takes one back
+#   offers to the turn player that weren't accepted or agreed on are rejected once their turn ends
+#   messages that don't make sense are counted as invalid and dropped, they never stop the table
+# the rules stay in Grass, a turn here takes the same steps as Player.move, so seeded tables with
+# unthreaded BehaviourAgents play exactly like Grass.play_round
+PHASES = {DRAW: "draw", PLAY: "play"}
+ANSWERS = {"accept": AcceptOffer, "agree": AgreeOffer, "reject": RejectOffer, "retract": RetractOffer}
+
+
+def card_name(card) -> list:
+    return [card.type, card.value] if card else None
+
+
+def public_view(game: Grass) -> dict:
+    """ everything on the table that every player can see, as plain json types """
+    return {
+        "status": game.status,
+        "round": game.round,
+        "turn": game.turn,
+        "turn_player": game.turn_player,
+        "deck": len(game.deck),
+        "waste_top": card_name(game.waste.top()),
+        "waste_status": game.waste_status,
+        "players": [{"name": pl.name, "score": pl.score, "hand": len(pl.hand), "skips": pl.skips,
+                     "stash": [card_name(c) for c in pl.stash], "hassle_top": card_name(pl.hassle.top())}
+                    for pl in game.players],
+    }
+
+
+def observe(game: Grass, seat: int, phase: str, legal: list[int] = ()) -> dict:
+    """ everything the player of the seat can see: the table, the own hand and the own offers """
+    player = game.players[seat]
+    offers = {offer.id: offer for offer in game.offers.targeting(player) + game.offers.authored(player)}
+    observation = public_view(game)
+    observation.update(seat=seat, phase=phase, legal=list(legal), hand=[card_name(c) for c in player.hand],
+                       offers=[offer_message(game, offer) for offer in offers.values()])
+    return observation
+
+
+def offer_message(game: Grass, offer: Offer) -> dict:
+    message = {"id": offer.id, "author": game.players.index(offer.player),
+               "target": game.players.index(offer.target), "status": offer.status}
+    if len(offer.actions) == 1 and isinstance(offer.actions[0], CardTrade):
+        message["give"] = offer.actions[0].my_card_type
+        message["take"] = offer.actions[0].your_card_type
+    return message
+
+
+def rebind(action: PlayCard, table: Grass, game: Grass) -> PlayCard:
+    """ a play chosen on a clone of the table, as the same play on the table itself """
+    def same(arg):
+        if arg is table:
+            return game
+        if isinstance(arg, Player):
+            return game.players[table.players.index(arg)]
+        return arg
+    return PlayCard(same(action.player), action.card_type, [same(arg) for arg in action.args], action.card_value)
+
+
+class Agent:
+    """ a seat of an AsyncTable, answers observations with actions, agents that never trade aren't asked to """
+    trades = True
+    # immediate agents answer draw and play right from the table with answer(phase), the table doesn't
+    # build them an observation or wait for them
+    immediate = False
+
+    async def act(self, observation: dict):
+        """ an action index for draw and play, a list of messages for trade """
+        raise NotImplementedError
+
+    def answer(self, phase: str):
+        """ the draw or play of an immediate agent, as an index or an Action """
+        raise NotImplementedError
+
+
+class BehaviourAgent(Agent):
+    """
+    the Behaviour of a local player as an agent, by default it chooses on a clone of the table in a worker thread,
+    so a slow policy doesn't block the event loop, and a late answer can't touch the table anymore:
+    the clone draws from a stream of its own, seeded from the stream of the seat before the thread starts,
+    so seeded tables stay reproducible as long as the choices are, but don't play like Grass.play_round
+    every agent has a single worker thread of its own, a late decision can't be stopped and keeps running there,
+    and the decisions of the seat are late until it is done, but it never holds up other seats or tables
+    unthreaded, it chooses right on the table as an immediate agent, which is much faster, as long as the policy is
+    """
+    # just like Player.trade, which doesn't trade yet
+    trades = False
+
+    def __init__(self, game: Grass, seat: int, threaded: bool = True):
+        self.game = game
+        self.seat = seat
+        self.threaded = threaded
+        self.immediate = not threaded
+        # the worker thread, started with the first threaded decision, and the decision it works on
+        self.executor = None
+        self.pending = None
+
+    async def act(self, observation: dict):
+        if observation["phase"] == "draw" or not self.threaded:
+            return self.answer(observation["phase"])
+        if self.pending is not None and not self.pending.done():
+            # the last decision is still running past its deadline, so this one is late as well
+            raise asyncio.TimeoutError
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(1)
+        table = self.game.clone(random.Random(self.game.players[self.seat].rng.getrandbits(64)))
+        self.pending = asyncio.get_running_loop().run_in_executor(self.executor, self.choose_play, table)
+        # cancelling at the deadline must not mark the decision done while the thread still works on it
+        return await asyncio.shield(self.pending)
+
+    def answer(self, phase: str):
+        if phase == "draw":
+            # just like Player.move, always from the deck
+            return DrawCard(self.game.players[self.seat], "deck")
+        return self.choose_play(self.game)
+
+    def choose_play(self, table: Grass) -> PlayCard:
+        player = table.players[self.seat]
+        play = player.behaviour.choose_play(player, table)
+        if play is None:
+            play = player.random_play(table)
+        return rebind(play, table, self.game) if table is not self.game else play
+
+
+def first_legal(observation: dict):
+    """ the default fallback: the first legal action, which draws from the deck, or nothing to trade """
+    if observation["phase"] == "trade":
+        return []
+    return observation["legal"][0]
+
+
+class AsyncTable:
+    """
+    A Grass table played by agents, one per seat, with a deadline in seconds for every decision
+    Late, failed or illegal answers are replaced by fallback(observation), and counted per seat
+    """
+
+    def __init__(self, game: Grass, agents: list[Agent], deadline: float = 1.0, trade_deadline: float = None,
+                 fallback: Callable[[dict], object] = first_legal):
+        self.game = game
+        self.agents = agents
+        self.deadline = deadline
+        self.trade_deadline = deadline if trade_deadline is None else trade_deadline
+        self.fallback = fallback
+        self.space = action_space(len(game.players))
+        self.timeouts = [0] * len(agents)
+        self.invalid = [0] * len(agents)
+
+    async def ask(self, seat: int, observation: dict, deadline: float):
+        """ the answer of an agent, or None if it was late or failed """
+        try:
+            return await asyncio.wait_for(self.agents[seat].act(observation), deadline)
+        except asyncio.TimeoutError:
+            self.timeouts[seat] += 1
+        except Exception:
+            self.invalid[seat] += 1
+        return None
+
+    async def decide(self, seat: int, phase: int) -> Action:
+        """ a draw or play of the seat, as an action that is legal right now """
+        game = self.game
+        player = game.players[seat]
+        agent = self.agents[seat]
+        legal = observation = None
+        if agent.immediate:
+            answer = agent.answer(PHASES[phase])
+        else:
+            legal = self.space.legal(game, player, phase)
+            observation = observe(game, seat, PHASES[phase], legal)
+            answer = await self.ask(seat, observation, self.deadline)
+        if isinstance(answer, Action):
+            if answer.player is player and isinstance(answer, (DrawCard, PlayCard)) and answer.viable(game):
+                return answer
+        elif isinstance(answer, int):
+            if legal is None:
+                legal = self.space.legal(game, player, phase)
+            if answer in legal:
+                return self.space.action(game, player, answer)
+        if answer is not None:
+            self.invalid[seat] += 1
+        if observation is None:
+            observation = observe(game, seat, PHASES[phase], legal or self.space.legal(game, player, phase))
+        return self.space.action(game, player, self.fallback(observation))
+
+    async def trade(self):
+        """ all seats send their trade messages at once, they are applied starting with the turn player """
+        game = self.game
+        seats = [seat for seat, agent in enumerate(self.agents) if agent.trades]
+        if not seats:
+            return
+        answers = await asyncio.gather(*(self.ask(seat, observe(game, seat, "trade"), self.trade_deadline)
+                                         for seat in seats))
+        answers = dict(zip(seats, answers))
+        start = game.turn_player
+        for seat in sorted(answers, key=lambda seat: (seat - start) % len(game.players)):
+            messages = answers[seat]
+            if not isinstance(messages, list):
+                continue
+            for message in messages:
+                try:
+                    valid = self.message(seat, message)
+                except Exception:
+                    valid = False
+                if not valid:
+                    self.invalid[seat] += 1
+
+    def message(self, seat: int, message) -> bool:
+        """ applies a trade message, returns if it made sense """
+        game = self.game
+        player = game.players[seat]
+        if not isinstance(message, dict) or len(message) != 1:
+            return False
+        (kind, body), = message.items()
+        if kind == "offer":
+            try:
+                target, give, take = body["target"], body["give"], body["take"]
+            except (TypeError, KeyError):
+                return False
+            if (type(target) is not int or not 0 <= target < len(game.players) or target == seat
+                    or not isinstance(give, str) or give not in TYPE_KINDS
+                    or not isinstance(take, str) or take not in TYPE_KINDS):
+                return False
+            target = game.players[target]
+            trade = CardTrade(player, target, give, take)
+            offer = Offer(player, target, [trade], [])
+            if not offer.viable(game):
+                return False
+            game.handle_action(offer)
+            return True
+        if kind in ANSWERS:
+            if type(body) is not int:
+                return False
+            offer = game.offers.offers.get(body)
+            if offer is None:
+                return False
+            action = ANSWERS[kind](player, offer)
+            if not action.viable(game):
+                return False
+            game.handle_action(action)
+            return True
+        return False
+
+    async def play_turn(self) -> bool:
+        """ the same steps as Grass.play_turn and Player.move, with the agents deciding """
+        game = self.game
+        if game.recording is not None:
+            game.recording.checkpoint(game)
+        seat = game.turn_player
+        player = game.players[seat]
+        extra_turn = game.extra_turn
+        game.extra_turn = False
+        game.turn += 1
+        moved = True
+        if player.skips:
+            game.handle_action(Skip(player))
+        elif not game.deck:
+            moved = False
+        else:
+            game.handle_action(await self.decide(seat, DRAW))
+            await self.trade()
+            game.handle_action(await self.decide(seat, PLAY))
+        if not moved and not extra_turn:
+            game.status = "cards ran out"
+        game.end_turn()
+        return game.status == "playing"
+
+    async def play_round(self):
+        self.game.start_round()
+        while await self.play_turn():
+            # agents that answer right away never give the loop back, so other tables get their turn here
+            await asyncio.sleep(0)
+        self.game.finish_round()
+
+    async def play_game(self, target: int = WINNING_SCORE, keep_rounds: int = None,
+                        on_round: Callable[[Grass, list[float]], None] = None,
+                        max_rounds: int = MAX_ROUNDS) -> list[int]:
+        """ a whole game, just like Grass.play_game """
+        game = self.game
+        game.start_game()
+        while max_rounds is None or game.round < max_rounds:
+            before = [pl.score for pl in game.players]
+            await self.play_round()
+            if on_round is not None:
+                on_round(game, [pl.score - score for pl, score in zip(game.players, before)])
+            game.trim_history(keep_rounds)
+            winners = game.check_winner(target)
+            if winners:
+                return winners
+        game.status = "game over"
+        return []
+
+
+def local_table(game: Grass, deadline: float = 1.0, threaded: bool = True) -> AsyncTable:
+    """ a table of its own players, all of them as BehaviourAgents """
+    agents = [BehaviourAgent(game, seat, threaded) for seat in range(len(game.players))]
+    return AsyncTable(game, agents, deadline)
+
+
+async def play_tables(tables: list[AsyncTable], rounds: int = 1):
+    """ plays rounds on all tables at once, in the running event loop """
+    async def play(table: AsyncTable):
+        for r in range(rounds):
+            await table.play_round()
+    await asyncio.gather(*(play(table) for table in tables))
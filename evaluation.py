@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import random
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from behaviour import Behaviour, naive_eval, concept_name
+from card import CARD_KINDS
+from legal import action_space
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from player import Player
+
+### Evaluation:
+# concept value tables (see behaviour.naive_eval) are keyed by card names like 'Peddle25k' and statuses,
+# compile_values turns one into a single weight vector over the features of a position, in this order:
+# - counts of every card kind on the hand, then on the stash, straight from Zone.counts
+# - one flag per status of STATUSES: 'ready' is neither heated nor skipping, 'marked opened' has a stashed
+#   market open, 'heated' has heat on top of the hassle pile and 'skip' still has turns to skip
+# a position is then scored with one dot product, and a batch of positions with one matrix product
+# concepts missing from a table weigh 0, names that are no card kind or status are ignored
+KINDS = len(CARD_KINDS)
+STATUSES = ["ready", "marked opened", "heated", "skip"]
+HAND = slice(0, KINDS)
+STASH = slice(KINDS, 2 * KINDS)
+STATUS = slice(2 * KINDS, 2 * KINDS + len(STATUSES))
+FEATURES = 2 * KINDS + len(STATUSES)
+MARKET = next(c.kind for c in CARD_KINDS if c.type == "mo")
+
+
+def compile_values(values: dict) -> np.ndarray:
+    """ the weights of a concept value table, one for every feature """
+    weights = np.zeros(FEATURES)
+    for part, columns in (("hand", HAND), ("stash", STASH)):
+        table = values.get(part, {})
+        weights[columns] = [table.get(concept_name(c), 0) for c in CARD_KINDS]
+    table = values.get("status", {})
+    weights[STATUS] = [table.get(status, 0) for status in STATUSES]
+    return weights
+
+
+def feature_row(player: Player) -> list:
+    """ the features of the position of a player as a plain list, batches are built from these in one go """
+    heated = bool(player.heated())
+    return player.hand.counts + player.stash.counts + \
+        [not heated and not player.skips, player.stash.counts[MARKET], heated, player.skips > 0]
+
+
+def features(player: Player) -> np.ndarray:
+    return np.array(feature_row(player), dtype=np.float64)
+
+
+def batch_features(players: list[Player]) -> np.ndarray:
+    """ the features of many positions, one row per player """
+    return np.array([feature_row(pl) for pl in players], dtype=np.float64).reshape(-1, FEATURES)
+
+
+class Evaluator:
+    """ scores positions with the compiled weights of a concept value table """
+
+    def __init__(self, values: dict = naive_eval):
+        self.values = values
+        self.weights = compile_values(values)
+
+    def score(self, player: Player) -> float:
+        return float(features(player) @ self.weights)
+
+    def score_table(self, game: Grass) -> np.ndarray:
+        """ the scores of all seats """
+        return batch_features(game.players) @ self.weights
+
+    def successors(self, game: Grass, player: Player, moves: list[int]) -> np.ndarray:
+        """
+        the features of the player after each move of the action space (see legal.py), one row per move
+        every move is played on its own clone of the table, random effects like paranoia passing draw from
+        a copy of the random stream of the player, so evaluating never changes how the game goes on
+        """
+        space = action_space(len(game.players))
+        seat = game.players.index(player)
+        after = []
+        rng = random.Random()
+        state = player.rng.getstate()
+        for move in moves:
+            rng.setstate(state)
+            table = game.clone(rng)
+            me = table.players[seat]
+            table.handle_action(space.action(table, me, move))
+            after.append(me)
+        return batch_features(after)
+
+    def score_moves(self, game: Grass, player: Player, moves: list[int]) -> np.ndarray:
+        """ the score of the player after each of the moves, all at once """
+        return self.successors(game, player, moves) @ self.weights
+
+
+class Greedy(Behaviour):
+    """ plays the card that leads to the best position by its own concept values, one move ahead """
+
+    def __init__(self):
+        super().__init__()
+        self.evaluator = None
+
+    def evaluate(self) -> Evaluator:
+        """ the compiled concept values, compiled again once they were replaced, tables must not change in place """
+        if self.evaluator is None or self.evaluator.values is not self.concept_values:
+            self.evaluator = Evaluator(self.concept_values)
+        return self.evaluator
+
+    def choose_play(self, player, game):
+        space = action_space(len(game.players))
+        moves = space.legal(game, player)
+        if not moves:
+            return None
+        scores = self.evaluate().score_moves(game, player, moves)
+        return space.action(game, player, moves[int(np.argmax(scores))])
@@ -1,7 +1,20 @@
+from __future__ import annotations
+
 import random
+from typing import TYPE_CHECKING, Callable
+
 from card import *
 from action import *
 from player import Player
+from replay import Recording
+from protection import PEDDLE_VALUES
+from zone import Zone, Pile, LazyPile, SHARED_RANDOM
+from locations import CardLocations
+from offers import OfferBook
+
+if TYPE_CHECKING:
+    from store import TrajectoryWriter
+
 ### Grass Rules:
 # 24 different card types
 # - pebble money cards (4): 12x5k, 10x25k, 5x50k, 1x100k
@@ -20,19 +33,194 @@ from player import Player
 # - paranoia cards let every player send one card to the left
 # -
 # - first to be at 250k total wins
+WINNING_SCORE = 250000
+# scores can just as well drift below 0 for good, so simulated games are cut off after this many rounds
+MAX_ROUNDS = 200
+
+### Random streams:
+# a table with a seed draws everything random from its own streams and never touches the random module:
+# the deck has one stream, the policy of every seat another (random plays, targets, cards sent left, searches)
+# every stream is derived from the seed and its name alone, so any game is regenerated exactly from its seed,
+# no matter what else ran before, next to it or in other threads
+# without a seed, the table and its players draw from the stream of the random module, so random.seed() works
+# a clone draws everything from a single stream, given to it or seeded from the state of the stream of the table,
+# so playing on a clone never moves the streams of the table, and clones of the same state play alike
+
+
+def stream(seed, *names) -> random.Random:
+    """ the random stream of a name under a seed, string seeds are hashed, so streams are independent """
+    return random.Random("/".join(map(str, (seed, *names))))
 
 
 class Grass:
-    def __init__(self, players: list[Player]):
+    def __init__(self, players: list[Player], record: bool = False, store: TrajectoryWriter = None,
+                 large: bool = False, locate: bool = False, seed=None):
         self.status = "initializing"
         self.players = players
-        self.waste = []
+        self.seed = seed
+        self.rng = SHARED_RANDOM
+        if seed is not None:
+            self.seed_streams(seed)
+        self.waste = Zone()
         self.waste_status = "discarded"
+        # cards out of the round, like peddle that got protected
+        self.aside = Zone()
         self.deck = []
         self.card_pool = []
         self.rounds = []
+        # rounds started in this game, the history in rounds might be cut short (see play_game)
+        self.round = 0
         self.turn = 0
+        self.turn_player = 0
+        self.extra_turn = False
+        self.passing = False
         self.winner = "none"
+        # compact recordings of every round (see replay.py), if wanted, also appended to a store (see store.py)
+        self.store = store
+        self.record = record or store is not None
+        self.recordings = []
+        self.recording = None
+        # large table mode, see track_zones
+        self.large = large
+        self.peddle_holders = None
+        self.banker_holders = None
+        if large:
+            self.track_zones()
+        # open offers of the round
+        self.offers = OfferBook()
+        # everyone watching the actions, like the belief trackers of Thinking
+        self.observers = []
+        # where every card of the table is, if wanted (see locations.py)
+        self.locations = CardLocations(self) if locate else None
+        self.watch_players()
+
+    def watch_players(self):
+        """ players whose behaviour uses beliefs (see Behaviour.watches) track them on this table """
+        for pl in self.players:
+            if pl.behaviour.watches:
+                pl.knowledge_base.watch(self)
+
+    def seed_streams(self, seed):
+        """ gives the deck and every seat their own random streams, derived from the seed """
+        self.seed = seed
+        self.rng = stream(seed, "deck")
+        for seat, pl in enumerate(self.players):
+            pl.rng = stream(seed, "seat", seat)
+
+    def use_rng(self, rng: random.Random):
+        """ lets the deck and all seats draw from a single stream, for clones played on and thrown away """
+        self.rng = rng
+        if isinstance(self.deck, LazyPile):
+            self.deck.rng = rng
+        for pl in self.players:
+            pl.rng = rng
+
+    def track_zones(self):
+        """
+        for tables with hundreds of players, nothing that happens to a single player should walk the whole table:
+        - the seats with stashed peddle and the seats holding the banker are kept up to date by the zones
+        - the deck is shuffled while drawing, unless the round is recorded
+        - passing cards left is a rotation of the chosen cards, without actions, unless the round is recorded
+        """
+        self.peddle_holders = set()
+        self.banker_holders = set()
+        banker = [get_card("ba").kind]
+        peddle = [get_card("pd", value).kind for value in PEDDLE_VALUES]
+        for seat, pl in enumerate(self.players):
+            pl.stash.track(peddle, self.peddle_holders, seat)
+            pl.hand.track(banker, self.banker_holders, seat)
+
+    def peddle_stashes(self) -> list[Player]:
+        """ all players that might have stashed peddle """
+        if self.peddle_holders is None:
+            return self.players
+        return [self.players[seat] for seat in sorted(self.peddle_holders)]
+
+    def clone(self, rng: random.Random = None) -> Grass:
+        """
+        copies only the state of the current round for lookahead, cards are shared and the deck is copy on write
+        the clone starts without history and doesn't record, so it can be played on and thrown away
+        it draws everything random from rng, by default from a stream of its own (see Random streams)
+        """
+        game = Grass.__new__(Grass)
+        game.status = self.status
+        game.players = [pl.clone() for pl in self.players]
+        game.waste = self.waste.copy()
+        game.waste_status = self.waste_status
+        game.aside = self.aside.copy()
+        game.deck = self.deck.copy()
+        game.seed = self.seed
+        game.rng = self.rng
+        game.card_pool = self.card_pool
+        game.rounds = [[]]
+        game.round = self.round
+        game.turn = self.turn
+        game.turn_player = self.turn_player
+        game.extra_turn = self.extra_turn
+        game.passing = self.passing
+        game.winner = self.winner
+        game.store = None
+        game.record = False
+        game.recordings = []
+        game.recording = None
+        game.large = self.large
+        game.peddle_holders = None
+        game.banker_holders = None
+        if self.large:
+            game.track_zones()
+        game.observers = []
+        # offers hold on to the original players, so clones start without any
+        game.offers = OfferBook()
+        game.locations = CardLocations(game) if self.locations is not None else None
+        # the hash of the state seeds a stream unlike the one of the table, without drawing from it
+        game.use_rng(rng or random.Random(hash(self.rng.getstate())))
+        return game
+
+    def view(self, player: Player, rng: random.Random = None, beliefs=None) -> Grass:
+        """
+        a clone as the player could imagine it: own hand and everything tabled stays as is,
+        but the cards hidden from the player (the deck and the other hands) are dealt anew at random
+        with beliefs (see Thinking.beliefs), every hand card is dealt by the expected count of its kind in that hand,
+        otherwise all hidden cards are equally likely anywhere
+        the clone draws everything random from rng, by default the stream of the player
+        """
+        rng = rng or player.rng
+        game = self.clone(rng)
+        seat = self.players.index(player)
+        others = [(i, pl) for i, pl in enumerate(game.players) if i != seat]
+        hidden = list(game.deck)
+        for i, pl in others:
+            hidden.extend(pl.hand)
+        if beliefs is None:
+            rng.shuffle(hidden)
+            for i, pl in others:
+                size = len(pl.hand)
+                pl.hand.clear()
+                pl.hand.extend(hidden[len(hidden) - size:])
+                del hidden[len(hidden) - size:]
+            game.deck = Pile(hidden)
+            return game
+        # cards of a kind are all the same instance, so hands are dealt as kinds, every hidden card of a kind
+        # is in the hand with the chance of the expected count over all hidden cards of the kind
+        # every kind keeps a small weight, so hands can always be filled
+        totals = [0] * len(CARD_KINDS)
+        for c in hidden:
+            totals[c.kind] += 1
+        left = totals.copy()
+        kinds = range(len(CARD_KINDS))
+        for i, pl in others:
+            size = len(pl.hand)
+            pl.hand.clear()
+            row = beliefs[i]
+            for n in range(size):
+                weights = [(row[kind] / totals[kind] + 0.001) * left[kind] if left[kind] else 0 for kind in kinds]
+                kind = rng.choices(kinds, weights)[0]
+                left[kind] -= 1
+                pl.hand.append(CARD_KINDS[kind])
+        hidden = [CARD_KINDS[kind] for kind in kinds for n in range(left[kind])]
+        rng.shuffle(hidden)
+        game.deck = Pile(hidden)
+        return game
 
     def discard(self, card: Card):
         """ handles discarding a card to the discard pile """
@@ -44,17 +232,38 @@ class Grass:
         self.waste_status = "played"
         self.waste.append(card)
 
-    def initialize_round(self):
+    def put_aside(self, card: Card):
+        """ takes a card out of the round """
+        self.aside.append(card)
+
+    def initialize_round(self, deck: list[Card] = None):
+        """ clears the table for a new round and shuffles the deck, unless the deck order is given """
         for pl in self.players:
-            pl.hand = []
-        self.waste = []
-        self.deck = []
-        decks = len(self.players)//10 + 1
-        for i in range(decks):
-            self.deck.extend(new_deck())
-        random.shuffle(self.deck)
+            pl.hand.clear()
+            pl.stash.clear()
+            pl.hassle.clear()
+            pl.skips = 0
+        self.waste.clear()
+        self.aside.clear()
+        self.offers.clear()
+        self.extra_turn = False
+        self.passing = False
+        if deck is None:
+            deck = []
+            decks = len(self.players)//10 + 1
+            for i in range(decks):
+                deck.extend(new_deck())
+            if self.large and not self.record:
+                self.deck = LazyPile(deck, self.rng)
+                return
+            self.rng.shuffle(deck)
+        self.deck = Pile(deck)
 
     def find_banker(self):
+        if self.banker_holders is not None:
+            return min(self.banker_holders, default=-1)
+        if self.locations is not None:
+            return min(self.locations.holders(get_card("ba").kind), default=-1)
         for i, pl in enumerate(self.players):
             if pl.check_hand_card("ba"):
                 return i
@@ -66,33 +275,79 @@ class Grass:
         round_summary = []
         for pl in self.players:
             values = pl.eval_self()
-            stash = getattr(values, "stash")
+            stash = values["stash"]
             if banker >= 0:
                 self.players[banker].score += 0.2 * stash
                 stash -= 0.2 * stash
-            round_result = stash + getattr(values, "protected") + getattr(values, "hand")
+            round_result = stash + values["protected"] + values["hand"]
             pl.score += round_result
             round_summary.append(round_result)
         return round_summary
 
     def handle_action(self, action: Action):
+        # every action passes through here, see instrument.py before adding anything
         if action.viable(self):
-            self.rounds[-1].append(action)
-            action.effect(self)
+            self.apply_action(action)
+
+    def apply_action(self, action: Action):
+        """ takes a viable action into the history and lets it take effect """
+        self.rounds[-1].append(action)
+        if self.recording is not None:
+            self.recording.add(action, self.turn)
+        action.effect(self)
+        for observer in self.observers:
+            observer.observe(self, action)
+        if self.passing:
+            self.pass_cards_left()
+
+    def pass_cards_left(self):
+        """ every player chooses a hand card to send left first, then all of them are passed at once """
+        self.passing = False
+        if self.large and self.recording is None and not self.observers:
+            cards = [pl.send_card_left() for pl in self.players]
+            cards = [pl.hand.take(c.type, c.value) if c else None for pl, c in zip(self.players, cards)]
+            for i, c in enumerate(cards):
+                if c:
+                    self.players[(i + 1) % len(self.players)].hand.append(c)
+            return
+        passes = []
+        for i, pl in enumerate(self.players):
+            card = pl.send_card_left()
+            if card:
+                passes.append(PassCard(pl, self.players[(i + 1) % len(self.players)], card.type, card.value))
+        for ac in passes:
+            self.handle_action(ac)
 
-    def market_place(self, player):
+    def market_place(self, player: Player) -> tuple[list[Offer], list[Offer]]:
         """
         This function handles resolving open offers and returns a list of all
         open offers currently available to accept as well as which offers
-        were already rejected or agreed on.
+        were already agreed on (rejected offers leave the book, see offers.py)
         """
+        available = []
+        agreed = []
+        for offer in self.offers.targeting(player):
+            if offer.status == "agreed":
+                agreed.append(offer)
+            if AcceptOffer(player, offer).viable(self):
+                available.append(offer)
+        return available, agreed
 
-    def play_round(self):
+    def start_round(self, deck: list[Card] = None):
+        """ sets up a new round up to the first turn, with a shuffled deck unless the deck order is given """
         self.status = "setup"
         self.rounds.append([])
+        self.round += 1
         self.turn = 0
-        self.initialize_round()
-        self.card_pool = self.deck.copy()
+        self.initialize_round(deck)
+        self.card_pool = list(self.deck)
+        if self.locations is not None:
+            self.locations.set_pool(self.card_pool)
+        #starting player
+        self.turn_player = self.round % len(self.players)
+        if self.record:
+            self.recording = Recording(self)
+            self.recordings.append(self.recording)
 
         # draw initial hand cards
         for count in range(6):
@@ -101,17 +356,126 @@ class Grass:
 
         # initial card on waste pile
         self.waste.append(self.deck.pop())
+        self.status = "playing"
+        for observer in self.observers:
+            observer.start_round(self)
+
+    def play_turn(self) -> bool:
+        """ lets the turn player move, returns if the round goes on """
+        if self.recording is not None:
+            self.recording.checkpoint(self)
+        pl = self.players[self.turn_player]
+        # an extra turn from nirvana, that finds no cards left doesn't end the round yet
+        extra_turn = self.extra_turn
+        self.extra_turn = False
+        if not(pl.move(self)) and not extra_turn:
+            self.status = "cards ran out"
+        self.end_turn()
+        return self.status == "playing"
+
+    def end_turn(self):
+        if self.offers:
+            self.offers.end_turn(self.players[self.turn_player])
+        if not self.extra_turn:
+            self.turn_player = (self.turn_player + 1) % len(self.players)
+
+    def play_round(self):
+        self.start_round()
 
         # game mainloop
-        self.status = "playing"
+        while self.play_turn():
+            pass
 
-        #starting player
-        turn_player = len(self.rounds) % len(self.players)
-        while self.status == "playing":
-            pl = self.players[turn_player]
-            if not(pl.move(self)):
-                self.status = "cards ran out"
-            turn_player = (turn_player + 1) % len(self.players)
+        self.finish_round()
 
+    def finish_round(self):
+        """ scores the round that just ended and puts its recording away """
         self.score_round()
         self.status = "between rounds"
+        if self.recording is not None:
+            self.recording.finish(self)
+            if self.store is not None:
+                self.store.append(self.recording)
+        self.recording = None
+
+    def play_game(self, target: int = WINNING_SCORE, keep_rounds: int = None,
+                  on_round: Callable[[Grass, list[float]], None] = None, max_rounds: int = MAX_ROUNDS) -> list[int]:
+        """
+        plays a whole game from scores of 0, round after round until a score exceeds the target
+        the highest score wins, a shared highest score is a draw, winner is set to the name of the winner or 'draw'
+        - every round the next seat starts, and hands, stashes, hassle piles and skips are dealt anew
+        - on_round(game, results) is called after every round with the score changes of all seats
+        - keep_rounds only keeps the actions and recordings of that many of the last rounds, so the memory of
+          a long game stays flat, on_round still sees the whole history of the round that just ended
+        returns the seats of the winners, more than one for a draw, none if max_rounds were played without a winner
+        (max_rounds None plays on until there is one)
+        """
+        self.start_game()
+        while max_rounds is None or self.round < max_rounds:
+            before = [pl.score for pl in self.players]
+            self.play_round()
+            if on_round is not None:
+                on_round(self, [pl.score - score for pl, score in zip(self.players, before)])
+            self.trim_history(keep_rounds)
+            winners = self.check_winner(target)
+            if winners:
+                return winners
+        self.status = "game over"
+        return []
+
+    def start_game(self):
+        """ scores back to 0 and no history of earlier games """
+        for pl in self.players:
+            pl.score = 0
+        self.round = 0
+        self.rounds = []
+        self.recordings = []
+        self.winner = "none"
+
+    def reset(self, seed=None):
+        """
+        a played table back to how a new Grass(players, seed=seed) starts out, keeping every object,
+        so finished tables can host the next game (see server.TablePool)
+        """
+        self.status = "initializing"
+        self.seed = seed
+        self.use_rng(SHARED_RANDOM)
+        if seed is not None:
+            self.seed_streams(seed)
+        for pl in self.players:
+            pl.hand.clear()
+            pl.stash.clear()
+            pl.hassle.clear()
+            pl.skips = 0
+        self.waste.clear()
+        self.waste_status = "discarded"
+        self.aside.clear()
+        self.deck = []
+        self.card_pool = []
+        self.turn = 0
+        self.turn_player = 0
+        self.extra_turn = False
+        self.passing = False
+        self.recording = None
+        self.offers = OfferBook()
+        self.observers = []
+        if self.locations is not None:
+            self.locations = CardLocations(self)
+        self.watch_players()
+        self.start_game()
+
+    def trim_history(self, keep_rounds: int = None):
+        """ only keeps the actions and recordings of the last rounds, all of them without keep_rounds """
+        if keep_rounds is not None:
+            del self.rounds[:max(0, len(self.rounds) - keep_rounds)]
+            del self.recordings[:max(0, len(self.recordings) - keep_rounds)]
+
+    def check_winner(self, target: int = WINNING_SCORE) -> list[int]:
+        """ ends the game once a score exceeds the target, returns the seats with the highest score then """
+        best = max(pl.score for pl in self.players)
+        if best <= target:
+            return []
+        winners = [seat for seat, pl in enumerate(self.players) if pl.score == best]
+        self.winner = self.players[winners[0]].name if len(winners) == 1 else "draw"
+        self.status = "game over"
+        return winners
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from collections import Counter
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Callable
+
+from action import Action
+
+if TYPE_CHECKING:
+    from grass import Grass
+
+### Instrumentation:
+# Grass.handle_action stays untouched, attaching replaces it on that one game instance only,
+# so tables without instrumentation don't pay anything for it
+# - counts and times of viable and effect per Action class, times are in nanoseconds
+# - plays, discards (cards played without effect end up discarded) and effect times per card type
+# - effect times include everything the effect sets off, like the passing of paranoia or accepted offers
+# - subscribers are called as callback(game, action, viable) for every action, after it took effect
+# results are plain counters, so they can be dumped per round, reset, or merged over a whole batch
+
+
+class Instrumentation:
+    """ collects what passes through Grass.handle_action of all attached games """
+
+    def __init__(self):
+        self.subscribers = []
+        self.reset()
+
+    def reset(self):
+        self.actions = Counter()
+        self.failed = Counter()
+        self.viable_ns = Counter()
+        self.effect_ns = Counter()
+        self.plays = Counter()
+        self.discards = Counter()
+        self.play_ns = Counter()
+
+    def subscribe(self, callback: Callable[[Grass, Action, bool], None]):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Grass, Action, bool], None]):
+        self.subscribers.remove(callback)
+
+    def attach(self, game: Grass):
+        """ routes all actions of the game through the instrumentation """
+        apply_action = game.apply_action
+        clock = perf_counter_ns
+
+        def handle_action(action: Action):
+            name = type(action).__name__
+            start = clock()
+            viable = action.viable(game)
+            checked = clock()
+            self.viable_ns[name] += checked - start
+            if not viable:
+                self.failed[name] += 1
+            else:
+                waste = len(game.waste)
+                apply_action(action)
+                spent = clock() - checked
+                self.actions[name] += 1
+                self.effect_ns[name] += spent
+                ctype = getattr(action, "card_type", None)
+                if ctype is not None and name == "PlayCard":
+                    self.plays[ctype] += 1
+                    self.play_ns[ctype] += spent
+                    if len(game.waste) > waste and game.waste_status == "discarded" and \
+                            game.waste[waste].type == ctype:
+                        self.discards[ctype] += 1
+            for callback in self.subscribers:
+                callback(game, action, viable)
+
+        game.handle_action = handle_action
+        return game
+
+    @staticmethod
+    def detach(game: Grass):
+        game.__dict__.pop("handle_action", None)
+        return game
+
+    def merge(self, other: Instrumentation):
+        for name in ("actions", "failed", "viable_ns", "effect_ns", "plays", "discards", "play_ns"):
+            getattr(self, name).update(getattr(other, name))
+        return self
+
+    def __getstate__(self):
+        # callbacks stay in the process that subscribed them
+        state = self.__dict__.copy()
+        state["subscribers"] = []
+        return state
+
+    def to_dict(self) -> dict:
+        return {
+            "actions": {name: {"count": self.actions[name], "failed": self.failed[name],
+                               "viable_ns": self.viable_ns[name], "effect_ns": self.effect_ns[name]}
+                        for name in sorted(set(self.actions) | set(self.failed))},
+            "cards": {ctype: {"plays": self.plays[ctype], "discards": self.discards[ctype],
+                              "effect_ns": self.play_ns[ctype]}
+                      for ctype in sorted(self.plays)},
+        }
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import math
+import random
+import time
+from multiprocessing import Pool
+from typing import TYPE_CHECKING
+
+from action import PlayCard
+from behaviour import Behaviour
+from card import get_card
+from legal import action_space
+from replay import snapshot, restore
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from player import Player
+
+### Information Set MCTS:
+# the searching player only knows its own hand and the table, so every iteration of the search
+# plays on a different determinization: a clone of the game, where the deck and all other hands are dealt anew
+# the tree only holds the decisions of the searching player, as action indexes (see legal.py), all other players
+# and everything beyond the tree are played out at random, just like Player.random_play does
+# a move might only be possible in some determinizations (e.g. cards drawn later on), so children count how
+# often they were available and the UCB exploration term uses that count instead of the parents visits
+# - rollouts stop after a horizon of turns, then the round is scored as it is
+# - rewards are the own round result minus the mean of all others, squashed to about -1 to 1
+# - with more workers, every worker searches a tree of its own and the visits of the first moves are added up
+# - every search draws from a stream of its own, seeded with a single draw from the stream of the searching player,
+#   so the game goes on the same however many iterations fit into the budget, with iterations instead of a budget,
+#   seeded games with searching seats are reproduced exactly
+# - with beliefs (the default), the searching seat watches its tables (see Behaviour.watches), and determinizations
+#   deal the other hands by what it believes they hold (see Thinking.beliefs) instead of uniformly
+
+REWARD_SCALE = 100000
+BANKER = get_card("ba").kind
+
+
+def legal_plays(player: Player, game: Grass) -> list[int]:
+    """ the legal plays of the action space (see legal.py), the banker is only played if there is nothing else """
+    space = action_space(len(game.players))
+    moves = space.legal(game, player)
+    if len(moves) > 1 and space.discards + BANKER in moves:
+        moves.remove(space.discards + BANKER)
+    return moves
+
+
+def play_action(player: Player, game: Grass, move: int) -> PlayCard:
+    return action_space(len(game.players)).action(game, player, move)
+
+
+class Node:
+    """ statistics of a move of the searching player, its children are the moves of its next turn """
+    __slots__ = ("children", "visits", "total", "available")
+
+    def __init__(self):
+        self.children = {}
+        self.visits = 0
+        self.total = 0.0
+        self.available = 0
+
+
+class TreePolicy(Behaviour):
+    """ plays the searching players moves down the tree during one iteration, then leaves it to chance """
+
+    def __init__(self, root: Node, exploration: float):
+        super().__init__()
+        self.node = root
+        self.exploration = exploration
+        self.path = []
+
+    def choose_play(self, player, game):
+        node = self.node
+        if node is None:
+            return None
+        moves = legal_plays(player, game)
+        for move in moves:
+            child = node.children.get(move)
+            if child is not None:
+                child.available += 1
+        unexplored = [move for move in moves if move not in node.children]
+        if unexplored:
+            # expand a single new move, everything after it is a rollout
+            move = player.rng.choice(unexplored)
+            child = node.children[move] = Node()
+            child.available = 1
+            self.node = None
+        else:
+            move = max(moves, key=lambda m: self.ucb(node.children[m]))
+            child = node.children[move]
+            self.node = child
+        self.path.append(child)
+        return play_action(player, game, move)
+
+    def ucb(self, node: Node) -> float:
+        return node.total / node.visits + self.exploration * math.sqrt(math.log(node.available) / node.visits)
+
+
+def reward(game: Grass, seat: int, before: list[float]) -> float:
+    results = [pl.score - score for pl, score in zip(game.players, before)]
+    others = (sum(results) - results[seat]) / (len(results) - 1)
+    return math.tanh((results[seat] - others) / REWARD_SCALE)
+
+
+def search(game: Grass, seat: int, budget: float = 0.08, iterations: int = None, horizon: int = 30,
+           exploration: float = 0.7, root: Node = None, beliefs=None) -> Node:
+    """
+    runs ISMCTS for the player of the seat at its decision which card to play, right after drawing
+    stops after the budget in seconds or the number of iterations, whichever comes first
+    beliefs of the player (see Thinking.beliefs) weigh how the hidden cards are dealt
+    """
+    root = root or Node()
+    rollout = Behaviour()
+    # all determinizations, tree moves and rollouts draw from it (see Grass.view)
+    rng = random.Random(game.players[seat].rng.getrandbits(64))
+    deadline = time.perf_counter() + budget if budget else math.inf
+    player = game.players[seat]
+    done = 0
+    while (iterations is None or done < iterations) and time.perf_counter() < deadline:
+        done += 1
+        sim = game.view(player, rng, beliefs)
+        policy = TreePolicy(root, exploration)
+        for i, pl in enumerate(sim.players):
+            pl.behaviour = policy if i == seat else rollout
+        before = [pl.score for pl in sim.players]
+        # the first move is made right here, the rest of the turn is the same as in Grass.play_turn
+        sim.handle_action(policy.choose_play(sim.players[seat], sim))
+        sim.end_turn()
+        stop = sim.turn + horizon
+        while sim.status == "playing" and sim.turn < stop and sim.play_turn():
+            pass
+        sim.score_round()
+        result = reward(sim, seat, before)
+        for node in policy.path:
+            node.visits += 1
+            node.total += result
+    return root
+
+
+def search_worker(task: tuple) -> dict[int, tuple[int, float]]:
+    """ worker entry point, rebuilds the table from a snapshot and searches a tree of its own """
+    from grass import Grass
+    from player import Player
+    state, players, seat, seed, kwargs = task
+    game = Grass([Player(f"seat {i}", Behaviour()) for i in range(players)], seed=seed)
+    game.rounds = [[]]
+    restore(game, state)
+    root = search(game, seat, **kwargs)
+    return {move: (node.visits, node.total) for move, node in root.children.items()}
+
+
+class ISMCTS(Behaviour):
+    """
+    Chooses which card to play by information set monte carlo tree search, within a time budget per move
+    (in seconds) or a number of iterations, with more workers the search is spread over worker processes
+    with beliefs, the hidden cards are dealt by what the player believes, which it tracks on every table it sits at
+    """
+
+    def __init__(self, budget: float = 0.08, iterations: int = None, horizon: int = 30, exploration: float = 0.7,
+                 workers: int = 1, beliefs: bool = True):
+        super().__init__()
+        self.watches = beliefs
+        self.budget = budget
+        self.iterations = iterations
+        self.horizon = horizon
+        self.exploration = exploration
+        self.workers = workers
+        self.pool = None
+
+    def __getstate__(self):
+        # worker pools stay in the process that made them
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
+
+    def choose_play(self, player, game):
+        seat = game.players.index(player)
+        moves = legal_plays(player, game)
+        if len(moves) == 1:
+            return play_action(player, game, moves[0])
+        kwargs = {"budget": self.budget, "iterations": self.iterations, "horizon": self.horizon,
+                  "exploration": self.exploration}
+        knowledge = player.knowledge_base
+        # clones share the knowledge base of the player, which is up to date with the table they were made of
+        if self.watches and knowledge.seat == seat and len(knowledge.known) == len(game.players):
+            kwargs["beliefs"] = knowledge.beliefs(game)
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = Pool(self.workers)
+            # the budget also has to cover sending the table to the workers and back
+            kwargs["budget"] = self.budget and self.budget * 0.8
+            state = snapshot(game)
+            tasks = [(state, len(game.players), seat, player.rng.getrandbits(32), kwargs) for i in range(self.workers)]
+            visits = {}
+            for stats in self.pool.map(search_worker, tasks):
+                for move, (count, total) in stats.items():
+                    visits[move] = visits.get(move, 0) + count
+        else:
+            root = search(game, seat, **kwargs)
+            visits = {move: node.visits for move, node in root.children.items()}
+        if not visits:
+            return None
+        return play_action(player, game, max(visits, key=visits.get))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
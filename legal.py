@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from action import Action, DrawCard, PlayCard
+from card import CARD_KINDS
+from protection import PEDDLE_VALUES
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from player import Player
+
+### Action Space:
+# every action a player can take on their turn gets a fixed index, so legality is a boolean mask over all of them
+# - 0, 1: drawing from the deck or the waste pile
+# - then the effective plays of every card kind, in the order of CARD_KINDS:
+#   heat on once per target, steal once per target and peddle value, pay fine once per peddle value,
+#   every other kind just once
+# - then discarding every card kind, that is playing a held card that would have no effect
+# targets are given relative to the player, 1 is the player on the left, so the space is the same for every seat
+# a card that could be played with an effect can't be discarded, that is up to Card.play
+DRAW, PLAY, DISCARD = range(3)
+
+
+class ActionSpace:
+    """
+    The fixed action indexes of a table size, with masks of the legal actions of a player
+    Moves are (action, kind, target offset, peddle value), the index of a move never changes
+    """
+
+    def __init__(self, players: int):
+        self.players = players
+        self.moves = [(DRAW, -1, 0, 0), (DRAW, -1, 1, 0)]
+        for c in CARD_KINDS:
+            if c.type == "hn":
+                self.moves.extend((PLAY, c.kind, offset, 0) for offset in range(1, players))
+            elif c.type == "sn":
+                self.moves.extend((PLAY, c.kind, offset, value) for offset in range(1, players)
+                                  for value in PEDDLE_VALUES)
+            elif c.type == "pf":
+                self.moves.extend((PLAY, c.kind, 0, value) for value in PEDDLE_VALUES)
+            elif c.type != "ba":
+                self.moves.append((PLAY, c.kind, 0, 0))
+        self.discards = len(self.moves)
+        self.moves.extend((DISCARD, c.kind, 0, 0) for c in CARD_KINDS)
+        self.index = {move: i for i, move in enumerate(self.moves)}
+        self.size = len(self.moves)
+
+    def __len__(self):
+        return self.size
+
+    def legal(self, game: Grass, player: Player, phase: int = PLAY) -> list[int]:
+        """ indexes of all legal actions of the player, either drawing or playing a card """
+        if phase == DRAW:
+            draws = []
+            if game.deck:
+                draws.append(0)
+            if game.waste and game.waste_status == "discarded":
+                draws.append(1)
+            return draws
+
+        seat = game.players.index(player)
+        n = len(game.players)
+        heated = player.heated()
+        index = self.index
+        legal = []
+        for kind, count in enumerate(player.hand.counts):
+            if not count:
+                continue
+            c = CARD_KINDS[kind]
+            ctype = c.type
+            plays = []
+            if ctype == "hn":
+                plays = [index[PLAY, kind, offset, 0] for offset in range(1, n)
+                         if game.players[(seat + offset) % n].check_stash_card("mo")]
+            elif ctype == "sn":
+                if not heated:
+                    plays = [index[PLAY, kind, offset, value] for offset in range(1, n)
+                             for value in game.players[(seat + offset) % n].stash.peddle_values]
+            elif ctype == "pf":
+                if heated:
+                    plays = [index[PLAY, kind, 0, value] for value in player.stash.peddle_values]
+            elif ctype in ("ds", "dc", "du"):
+                plays = [index[PLAY, kind, 0, 0]]
+            elif ctype != "ba" and c.playable(player):
+                plays = [index[PLAY, kind, 0, 0]]
+            legal.extend(plays or [self.discards + kind])
+        return legal
+
+    def mask(self, game: Grass, player: Player, phase: int = PLAY) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.legal(game, player, phase)] = True
+        return mask
+
+    def action(self, game: Grass, player: Player, index: int) -> Action:
+        """ the action of an index, with the arguments Card.play takes """
+        what, kind, offset, value = self.moves[index]
+        if what == DRAW:
+            return DrawCard(player, "waste" if offset else "deck")
+        c = CARD_KINDS[kind]
+        if what == DISCARD:
+            # without an effect, every card ends up discarded, no matter who it is played on
+            offset = 1
+        target = game.players[(game.players.index(player) + offset) % len(game.players)]
+        if c.type == "hn":
+            args = [game, target]
+        elif c.type == "pf":
+            args = [player, game, value]
+        elif c.type == "sn":
+            args = [player, game, target, value]
+        elif c.type == "ba":
+            args = [game]
+        else:
+            args = [player, game]
+        return PlayCard(player, c.type, args, c.value)
+
+
+SPACES = {}
+
+
+def action_space(players: int) -> ActionSpace:
+    """ the shared action space of a table size """
+    if players not in SPACES:
+        SPACES[players] = ActionSpace(players)
+    return SPACES[players]
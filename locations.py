@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from card import CARD_KINDS, CARDS
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from card import Card
+
+### Card Locations:
+# cards are shared instances per kind, so a card is located by its kind: how many cards of a kind lie where
+# every zone of the table (waste, aside, and hand, stash and hassle pile of every seat) reports its changes here,
+# so the index is always up to date, no matter which action or card effect moved a card
+# the deck is never tracked card by card, whatever isn't anywhere else out of the rounds card pool is in the deck
+# zones are numbered: 0 is the waste, 1 the cards put aside, then hand, stash and hassle of seat 0, of seat 1, ...
+PARTS = ["hand", "stash", "hassle"]
+WASTE, ASIDE = 0, 1
+TABLE = ["waste", "aside"]
+
+
+def zone_id(part: str, seat: int = -1) -> int:
+    if part in TABLE:
+        return TABLE.index(part)
+    return 2 + 3 * seat + PARTS.index(part)
+
+
+def zone_name(zone: int) -> tuple[str, int]:
+    """ the part (or 'waste', 'aside') and seat of a zone, zones of the table have no seat (-1) """
+    if zone < len(TABLE):
+        return TABLE[zone], -1
+    return PARTS[(zone - 2) % 3], (zone - 2) // 3
+
+
+class CardLocations:
+    """ the number of cards of every kind in every zone of a table, as sparse dicts per kind """
+
+    def __init__(self, game: Grass):
+        self.seats = len(game.players)
+        self.pool = [0] * len(CARD_KINDS)
+        self.zones = [{} for c in CARD_KINDS]
+        self.attach(game)
+
+    def attach(self, game: Grass):
+        """ hooks all zones of the table up, counting what they hold right now """
+        self.zones = [{} for c in CARD_KINDS]
+        game.waste.locate(self, WASTE)
+        game.aside.locate(self, ASIDE)
+        for seat, pl in enumerate(game.players):
+            for part in PARTS:
+                getattr(pl, part).locate(self, zone_id(part, seat))
+        self.set_pool(game.card_pool)
+
+    def set_pool(self, cards: list[Card]):
+        """ the cards of the round, all cards that are in no zone are in the deck """
+        self.pool = [0] * len(CARD_KINDS)
+        for c in cards:
+            self.pool[c.kind] += 1
+
+    def added(self, zone: int, kind: int, count: int = 1):
+        zones = self.zones[kind]
+        zones[zone] = zones.get(zone, 0) + count
+
+    def removed(self, zone: int, kind: int, count: int = 1):
+        zones = self.zones[kind]
+        left = zones[zone] - count
+        if left:
+            zones[zone] = left
+        else:
+            del zones[zone]
+
+    @staticmethod
+    def kinds(ctype: str, cvalue: int = None) -> list[int]:
+        if cvalue is not None:
+            return [CARDS[(ctype, cvalue)].kind]
+        return [c.kind for c in CARD_KINDS if c.type == ctype]
+
+    def in_deck(self, kind: int) -> int:
+        return self.pool[kind] - sum(self.zones[kind].values())
+
+    def count(self, kind: int, part: str = None, seat: int = None) -> int:
+        """ cards of the kind in one zone, in a part of all seats (like all hands), or in the deck """
+        if part == "deck":
+            return self.in_deck(kind)
+        if part in TABLE:
+            return self.zones[kind].get(zone_id(part), 0)
+        if seat is not None:
+            return self.zones[kind].get(zone_id(part, seat), 0)
+        return sum(count for zone, count in self.zones[kind].items() if zone_name(zone)[0] == part)
+
+    def where(self, ctype: str, cvalue: int = None) -> Counter:
+        """ where all cards of the type (and value) are, as counts by (part, seat), the deck is ('deck', -1) """
+        found = Counter()
+        for kind in self.kinds(ctype, cvalue):
+            for zone, count in self.zones[kind].items():
+                found[zone_name(zone)] += count
+            if self.in_deck(kind):
+                found["deck", -1] += self.in_deck(kind)
+        return found
+
+    def holders(self, kind: int, part: str = "hand") -> list[int]:
+        """ seats that have a card of the kind in that part """
+        return sorted(seat for zone_part, seat in map(zone_name, self.zones[kind]) if zone_part == part)
+
+    def unseen(self, seat: int, kind: int) -> int:
+        """ cards of the kind the player of the seat can't see, in the deck or the other hands """
+        own = zone_id("hand", seat)
+        hands = sum(count for zone, count in self.zones[kind].items()
+                    if zone >= len(TABLE) and (zone - 2) % 3 == 0 and zone != own)
+        return self.in_deck(kind) + hands
+
+    def in_circulation(self, ctype: str, cvalue: int = None) -> int:
+        """ cards of the type that could still come into play, that is everything but the waste and aside """
+        return sum(self.pool[kind] - self.zones[kind].get(WASTE, 0) - self.zones[kind].get(ASIDE, 0)
+                   for kind in self.kinds(ctype, cvalue))
+
@@ -0,0 +1,476 @@
+import numpy as np
+
+from behaviour import naive_eval, concept_name
+from card import CARD_KINDS, DECK_TEMPLATE, get_card
+
+### Lockstep engine:
+# plays the same rules as Grass, but for a whole batch of games at once
+# every card is stored as its kind (see card.CARD_KINDS) and every zone of all games lives in one array:
+# - hands are [games, players, 7] slots, a hand always holds 6 cards between turns and the drawn card goes to slot 6
+# - stashes and hassle piles are [games, players, kinds] counts, plus the top card of every hassle pile
+# - internally all per player arrays are also viewed as rows of game * players + seat
+# every turn is then a handful of masked array operations over all games
+# the object engine in grass.py stays the reference for the rules
+# - the waste pile is only tracked as its top card, its status and counts per kind,
+#   so players always draw from the deck, just like Player.move does for now
+# - the random policy picks cards just like Player.move, but a hand of only unplayable
+#   TheBanker and MarketClose cards discards one of them instead of looking forever
+
+KINDS = len(CARD_KINDS)
+SLOTS = 7
+EMPTY = -1
+VALUES = np.array([c.value for c in CARD_KINDS], dtype=np.int64)
+TEMPLATE = np.array([c.kind for c in DECK_TEMPLATE], dtype=np.int8)
+
+MO = get_card("mo").kind
+MC = get_card("mc").kind
+PF = get_card("pf").kind
+ST = get_card("st").kind
+DS = get_card("ds").kind
+DU = get_card("du").kind
+SN = get_card("sn").kind
+BA = get_card("ba").kind
+PD5, PD25, PD50, PD100 = PEDDLE = np.array([get_card("pd", v).kind for v in (5000, 25000, 50000, 100000)])
+PR25, PR50 = PROTECTED = np.array([get_card("pr", v).kind for v in (25000, 50000)])
+# peddle and protected kinds are next to each other, so their counts can be sliced out of a stash
+PEDDLES = slice(PD5, PD100 + 1)
+PROTECTS = slice(PR25, PR50 + 1)
+assert (np.arange(KINDS)[PEDDLES] == PEDDLE).all() and (np.arange(KINDS)[PROTECTS] == PROTECTED).all()
+
+
+def kinds_of(ctype: str) -> np.ndarray:
+    return np.array([c.kind for c in CARD_KINDS if c.type == ctype])
+
+
+def value_table(ctypes: list[str]) -> np.ndarray:
+    """ card values of the given card types and 0 for every other kind, the extra last entry is no card (-1) """
+    return np.append(np.where([c.type in ctypes for c in CARD_KINDS], VALUES, 0), 0)
+
+
+HN, HF = kinds_of("hn"), kinds_of("hf")
+ST_EU = np.concatenate([kinds_of("st"), kinds_of("eu")])
+# lowest and highest peddle kind for every combination of held peddle values, as bits of 5k, 25k, 50k and 100k
+LOWEST = np.array([PD5 + (bits & -bits).bit_length() - 1 if bits else EMPTY for bits in range(16)])
+HIGHEST = np.array([PD5 + bits.bit_length() - 1 if bits else EMPTY for bits in range(16)])
+HAND_PENALTY = value_table(["pd", "ds", "dc", "du"]).astype(np.float64)
+HEAT_ON = value_table(["hn"])
+HEAT_OFF = value_table(["hf"])
+
+# card types in the order of the play handlers of LockstepGrass, nirvana and paranoia types share one
+TYPES = ["mo", "mc", "pd", "hn", "hf", "pf", "nirvana", "paranoia", "pr", "sn", "ba"]
+TYPE_OF = np.array([TYPES.index({"st": "nirvana", "eu": "nirvana", "ds": "paranoia", "dc": "paranoia",
+                                 "du": "paranoia"}.get(c.type, c.type)) for c in CARD_KINDS])
+
+PLAYING, CLOSED, RAN_OUT = 0, 1, 2
+DISCARDED, PLAYED = 0, 1
+
+
+def naive_preference(values: dict = naive_eval) -> np.ndarray:
+    """
+    how much the naive policy likes to play each card kind:
+    it gives up the value of the card on hand and gains its value on the stash, if it goes there
+    """
+    hand, stash = values["hand"], values["stash"]
+    preference = np.zeros(KINDS)
+    for c in CARD_KINDS:
+        name = concept_name(c)
+        preference[c.kind] = stash.get(name, 0) - hand.get(name, 0)
+    return preference
+
+
+class LockstepGrass:
+    """
+    A batch of Grass games with the same number of players, advanced one turn per step in all games together
+    Policies are 'random', 'naive' or a callable policy(engine, games, rows) -> (hand slots, target seats)
+    """
+
+    def __init__(self, games: int, players: int, policy="random", seed: int = None, values: dict = naive_eval):
+        if players < 2:
+            raise ValueError("Grass needs at least two players")
+        self.games = games
+        self.players = players
+        self.rng = np.random.default_rng(seed)
+        self.template = np.tile(TEMPLATE, players // 10 + 1)
+        if policy == "random":
+            self.policy = random_policy
+        elif policy == "naive":
+            self.policy = naive_policy
+        else:
+            self.policy = policy
+        self.preference = naive_preference(values)
+
+        self.deck = np.zeros((games, len(self.template)), dtype=np.int8)
+        self.deck_len = np.zeros(games, dtype=np.int64)
+        self.waste = np.zeros((games, KINDS), dtype=np.int16)
+        self.waste_top = np.full(games, EMPTY, dtype=np.int8)
+        self.waste_status = np.zeros(games, dtype=np.int8)
+        self.hand = np.full((games, players, SLOTS), EMPTY, dtype=np.int8)
+        self.stash = np.zeros((games, players, KINDS), dtype=np.int16)
+        self.hassle = np.zeros((games, players, KINDS), dtype=np.int16)
+        self.hassle_top = np.full((games, players), EMPTY, dtype=np.int8)
+        self.peddle_value = np.zeros((games, players), dtype=np.int64)
+        self.protected_value = np.zeros((games, players), dtype=np.int64)
+        self.peddle_bits = np.zeros((games, players), dtype=np.int64)
+        self.skips = np.zeros((games, players), dtype=np.int8)
+        self.score = np.zeros((games, players))
+        self.round_result = np.zeros((games, players))
+        self.rounds = np.zeros(games, dtype=np.int64)
+        self.turn = np.zeros(games, dtype=np.int64)
+        self.turn_player = np.zeros(games, dtype=np.int64)
+        self.extra = np.zeros(games, dtype=bool)
+        self.status = np.full(games, CLOSED, dtype=np.int8)
+        self.active = np.zeros(games, dtype=bool)
+
+        # the same memory as rows of game * players + seat
+        rows = games * players
+        self._hand = self.hand.reshape(rows, SLOTS)
+        self._stash = self.stash.reshape(rows, KINDS)
+        self._hassle = self.hassle.reshape(rows, KINDS)
+        self._hassle_top = self.hassle_top.reshape(rows)
+        self._peddle_value = self.peddle_value.reshape(rows)
+        self._protected_value = self.protected_value.reshape(rows)
+        self._peddle_bits = self.peddle_bits.reshape(rows)
+        self._skips = self.skips.reshape(rows)
+
+    def initialize_round(self, g: np.ndarray):
+        """ shuffles new decks, deals 6 hand cards to every player and turns the first waste card """
+        n, players = len(g), self.players
+        self.rounds[g] += 1
+        self.turn[g] = 0
+        self.turn_player[g] = self.rounds[g] % players
+        self.extra[g] = False
+        self.status[g] = PLAYING
+        self.active[g] = True
+        self.stash[g] = 0
+        self.hassle[g] = 0
+        self.hassle_top[g] = EMPTY
+        self.peddle_value[g] = 0
+        self.protected_value[g] = 0
+        self.peddle_bits[g] = 0
+        self.skips[g] = 0
+        self.waste[g] = 0
+
+        deck = self.rng.permuted(np.broadcast_to(self.template, (n, len(self.template))), axis=1)
+        # cards are popped from the end of the deck, one for every player in turns
+        dealt = deck[:, ::-1][:, :6 * players].reshape(n, 6, players)
+        hands = np.full((n, players, SLOTS), EMPTY, dtype=np.int8)
+        hands[:, :, :6] = dealt.transpose(0, 2, 1)
+        self.hand[g] = hands
+        self.deck[g] = deck
+        self.deck_len[g] = len(self.template) - 6 * players - 1
+        first = deck[np.arange(n), self.deck_len[g]]
+        self.waste[g, first] += 1
+        self.waste_top[g] = first
+        self.waste_status[g] = DISCARDED
+
+    def score_round(self, g: np.ndarray):
+        """ scores the stashes and hands of all players, the banker takes 20% of the unprotected stashes """
+        stash = self.peddle_value[g]
+        protected = self.protected_value[g]
+        hands = self.hand[g]
+        hand = -HAND_PENALTY[hands].sum(axis=-1)
+        has_banker = (hands == BA).any(axis=-1)
+        with_banker = has_banker.any(axis=1)
+        banker = has_banker.argmax(axis=1)
+
+        cut = np.where(with_banker[:, None], 0.2 * stash, 0)
+        result = stash - cut + protected + hand
+        result[np.arange(len(g)), banker] += np.where(with_banker, cut.sum(axis=1), 0)
+        self.round_result[g] = result
+        self.score[g] += result
+        self.active[g] = False
+
+    def play_round(self) -> np.ndarray:
+        """ plays a single round in every game and returns the round results """
+        self.initialize_round(np.arange(self.games))
+        while self.active.any():
+            self.step()
+        return self.round_result.copy()
+
+    def play_rounds(self, rounds: int) -> int:
+        """
+        plays rounds until at least the given number of rounds is finished over all games,
+        finished games start their next round right away, so the batch stays full
+        """
+        finished = 0
+        self.initialize_round(np.arange(self.games))
+        while finished < rounds and self.active.any():
+            done = self.step()
+            finished += len(done)
+            if len(done) and finished + self.active.sum() < rounds:
+                self.initialize_round(done)
+        return finished
+
+    def rows(self, g: np.ndarray, seats: np.ndarray) -> np.ndarray:
+        return g * self.players + seats
+
+    def table_rows(self, g: np.ndarray) -> np.ndarray:
+        """ [games, players] rows of every seat of the games """
+        return g[:, None] * self.players + np.arange(self.players)
+
+    def heated(self, r: np.ndarray) -> np.ndarray:
+        """ the value of the heat on top of the hassle piles, 0 if not heated """
+        return HEAT_ON[self._hassle_top[r]]
+
+    def market(self, r: np.ndarray) -> np.ndarray:
+        return self._stash[r, MO] > 0
+
+    def market_cap(self, r: np.ndarray) -> np.ndarray:
+        return self._peddle_value[r] + self._protected_value[r]
+
+    def peddle_counts(self, r: np.ndarray) -> np.ndarray:
+        """ counts of the stashed 5k, 25k, 50k and 100k peddle cards """
+        return self._stash.take(r, axis=0)[..., PEDDLES]
+
+    def lowest_peddle(self, r: np.ndarray) -> np.ndarray:
+        """ kind of the lowest stashed peddle card, -1 if there is none """
+        return LOWEST[self._peddle_bits[r]]
+
+    def highest_peddle(self, r: np.ndarray) -> np.ndarray:
+        """ kind of the highest stashed peddle card, -1 if there is none """
+        return HIGHEST[self._peddle_bits[r]]
+
+    def move_peddle(self, r: np.ndarray, kinds: np.ndarray, count: int):
+        """ adds (or with a negative count removes) peddle cards to stashes and keeps their values up to date """
+        self._stash[r, kinds] += count
+        self._peddle_value[r] += count * VALUES[kinds]
+        bit = 1 << (kinds - PD5)
+        bits = self._peddle_bits[r]
+        self._peddle_bits[r] = np.where(self._stash[r, kinds] > 0, bits | bit, bits & ~bit)
+
+    def protection(self, r: np.ndarray, value: int) -> np.ndarray:
+        """ peddle cards (5k, 25k, 50k) needed to protect the value, all -1 if not possible """
+        counts = self.peddle_counts(r)[:, :3]
+        if value == 25000:
+            options = [(0, 1, 0), (5, 0, 0)]
+        else:
+            options = [(0, 0, 1), (0, 2, 0), (5, 1, 0), (10, 0, 0)]
+        take = np.full((len(r), 3), -1, dtype=np.int16)
+        for option in options:
+            fits = (take[:, 0] < 0) & (counts >= option).all(axis=1)
+            take[fits] = option
+        return take
+
+    def discard(self, g: np.ndarray, kinds: np.ndarray):
+        self.waste[g, kinds] += 1
+        self.waste_top[g] = kinds
+        self.waste_status[g] = DISCARDED
+
+    def burn(self, g: np.ndarray, kinds: np.ndarray):
+        self.waste[g, kinds] += 1
+        self.waste_top[g] = kinds
+        self.waste_status[g] = PLAYED
+
+    def put_hassle(self, r: np.ndarray, kinds: np.ndarray):
+        self._hassle[r, kinds] += 1
+        self._hassle_top[r] = kinds
+
+    def other_player(self, r: np.ndarray) -> np.ndarray:
+        """ a random other seat than the one of the rows """
+        return (r + 1 + self.rng.integers(0, self.players - 1, len(r))) % self.players
+
+    def playable(self, r: np.ndarray) -> np.ndarray:
+        """ [rows, kinds] mask of which card kinds would take effect, targets aside """
+        heat = self.heated(r)
+        cool = heat == 0
+        market = self.market(r)
+        mask = np.ones((len(r), KINDS), dtype=bool)
+        mask[:, MO] = ~market
+        mask[:, MC] = cool & (self.market_cap(r) >= 50000)
+        mask[:, PEDDLE] = (cool & market)[:, None]
+        mask[:, HF] = heat[:, None] == HEAT_OFF[HF]
+        mask[:, PF] = ~cool & (self._peddle_value[r] > 0)
+        mask[:, ST_EU] = market[:, None]
+        for kind, value in ((PR25, 25000), (PR50, 50000)):
+            candidates = np.flatnonzero(cool & (self._peddle_value[r] >= value))
+            mask[:, kind] = False
+            mask[candidates, kind] = self.protection(r[candidates], value)[:, 0] >= 0
+        mask[:, SN] = cool
+        mask[:, BA] = False
+        return mask
+
+    def step(self) -> np.ndarray:
+        """ every active game takes one move, returns the games whose round ended with this step """
+        g = np.flatnonzero(self.active)
+        r = self.rows(g, self.turn_player[g])
+        self.turn[g] += 1
+
+        # skipping players only skip
+        skipping = self._skips[r] > 0
+        self._skips[r[skipping]] -= 1
+        moving, r = g[~skipping], r[~skipping]
+
+        # without cards in the deck the round ends, but an extra turn from nirvana just passes
+        empty = self.deck_len[moving] == 0
+        self.status[moving[empty & ~self.extra[moving]]] = RAN_OUT
+        self.extra[moving] = False
+        moving, r = moving[~empty], r[~empty]
+
+        # draw to the extra slot, then fill the gap of the played card with it
+        self.deck_len[moving] -= 1
+        self._hand[r, SLOTS - 1] = self.deck[moving, self.deck_len[moving]]
+        slots, targets = self.policy(self, moving, r)
+        kinds = self._hand[r, slots].astype(np.int64)
+        self._hand[r, slots] = self._hand[r, SLOTS - 1]
+        self._hand[r, SLOTS - 1] = EMPTY
+        self.play(moving, r, kinds, self.rows(moving, targets))
+
+        passing = g[~self.extra[g]]
+        self.turn_player[passing] = (self.turn_player[passing] + 1) % self.players
+        done = g[self.status[g] != PLAYING]
+        self.score_round(done)
+        return done
+
+    def play(self, g: np.ndarray, r: np.ndarray, kinds: np.ndarray, targets: np.ndarray):
+        """ deals the effects of the played cards, unplayable cards are discarded just like in Card.play """
+        handlers = [
+            self.play_market_open, self.play_market_close, self.play_peddle, self.play_heat_on,
+            self.play_heat_off, self.play_pay_fine, self.play_nirvana, self.play_paranoia,
+            self.play_protected, self.play_steal, self.play_banker,
+        ]
+        # group the games by the type of the played card
+        types = TYPE_OF[kinds]
+        for handled in np.flatnonzero(np.bincount(types, minlength=len(TYPES))):
+            games = np.flatnonzero(types == handled)
+            handlers[handled](g[games], r[games], kinds[games], targets[games])
+
+    def play_market_open(self, g, r, kinds, targets):
+        ok = ~self.market(r)
+        self._stash[r[ok], MO] += 1
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_market_close(self, g, r, kinds, targets):
+        ok = (self.heated(r) == 0) & (self.market_cap(r) >= 50000)
+        self.status[g[ok]] = CLOSED
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_peddle(self, g, r, kinds, targets):
+        ok = (self.heated(r) == 0) & self.market(r)
+        self.move_peddle(r[ok], kinds[ok], 1)
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_heat_on(self, g, r, kinds, targets):
+        ok = self.market(targets)
+        self.put_hassle(targets[ok], kinds[ok])
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_heat_off(self, g, r, kinds, targets):
+        ok = self.heated(r) == HEAT_OFF[kinds]
+        self.put_hassle(r[ok], kinds[ok])
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_pay_fine(self, g, r, kinds, targets):
+        fine = self.lowest_peddle(r)
+        ok = (self.heated(r) > 0) & (fine >= 0)
+        self.move_peddle(r[ok], fine[ok], -1)
+        self.burn(g[ok], fine[ok])
+        self.put_hassle(r[ok], kinds[ok])
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_nirvana(self, g, r, kinds, targets):
+        ok = self.market(r)
+        self.discard(g[~ok], kinds[~ok])
+        self.extra[g] = True
+        g, r, kinds = g[ok], r[ok], kinds[ok]
+        self.put_hassle(r, kinds)
+
+        # every player gives their lowest (StoneHigh) or highest (Euphoria) peddle card to the player
+        table = self.table_rows(g)
+        taken = np.where((kinds == ST)[:, None], self.lowest_peddle(table), self.highest_peddle(table))
+        has = taken >= 0
+        self.move_peddle(table[has], taken[has], -1)
+        for column in range(self.players):
+            gains = has[:, column]
+            self.move_peddle(r[gains], taken[gains, column], 1)
+
+    def play_paranoia(self, g, r, kinds, targets):
+        # every player sends a random one of their 6 hand cards to the player on their left
+        table = self.table_rows(g)
+        slots = self.rng.integers(0, 6, table.shape)
+        sent = self._hand[table, slots]
+        self._hand[table, slots] = np.roll(sent, 1, axis=1)
+
+        self._skips[r] = np.where(kinds == DS, 1, 2)
+        lost = np.where(kinds == DS, self.lowest_peddle(r), self.highest_peddle(r))
+        loses = (kinds != DU) & (lost >= 0)
+        self.move_peddle(r[loses], lost[loses], -1)
+        self.burn(g[loses], lost[loses])
+
+        wiped = kinds == DU
+        gw, rw = g[wiped], r[wiped]
+        self.waste[gw] += self._stash[rw] + self._hassle[rw]
+        self._stash[rw] = 0
+        self._hassle[rw] = 0
+        self._hassle_top[rw] = EMPTY
+        self._peddle_value[rw] = 0
+        self._protected_value[rw] = 0
+        self._peddle_bits[rw] = 0
+        self.burn(g, kinds)
+
+    def play_protected(self, g, r, kinds, targets):
+        take = np.where((kinds == PR25)[:, None], self.protection(r, 25000), self.protection(r, 50000))
+        ok = (self.heated(r) == 0) & (take[:, 0] >= 0)
+        self.discard(g[~ok], kinds[~ok])
+        r, take, kinds = r[ok], take[ok], kinds[ok]
+        self._stash[r, PD5:PD50 + 1] -= take
+        self._stash[r, kinds] += 1
+        self._peddle_value[r] -= VALUES[kinds]
+        self._protected_value[r] += VALUES[kinds]
+        held = self.peddle_counts(r) > 0
+        self._peddle_bits[r] = held @ (1 << np.arange(len(PEDDLE)))
+
+    def play_steal(self, g, r, kinds, targets):
+        stolen = self.highest_peddle(targets)
+        ok = (self.heated(r) == 0) & (stolen >= 0)
+        self.move_peddle(targets[ok], stolen[ok], -1)
+        self.move_peddle(r[ok], stolen[ok], 1)
+        self.burn(g[ok], kinds[ok])
+        self.discard(g[~ok], kinds[~ok])
+
+    def play_banker(self, g, r, kinds, targets):
+        self.discard(g, kinds)
+
+
+def random_policy(engine: LockstepGrass, g: np.ndarray, r: np.ndarray):
+    """ the random card choice of Player.move, targets are random opponents """
+    hand = engine._hand[r]
+    closing = (engine.heated(r) == 0) & (engine.market_cap(r) >= 50000)
+    # like Player.move, a first pick of TheBanker or MarketClose is redrawn until it hits any other card
+    # or a MarketClose that can close the market
+    slots = engine.rng.integers(0, SLOTS, len(r))
+    first = hand[np.arange(len(r)), slots]
+    redraw = np.flatnonzero((first == BA) | (first == MC))
+    hand, closing = hand[redraw], closing[redraw]
+    allowed = (hand != BA) & ((hand != MC) | closing[:, None])
+    allowed[~allowed.any(axis=1)] = True
+    slots[redraw] = np.where(allowed, engine.rng.random(allowed.shape), -1).argmax(axis=1)
+    return slots, engine.other_player(r)
+
+
+def naive_policy(engine: LockstepGrass, g: np.ndarray, r: np.ndarray):
+    """
+    plays the playable card with the best concept value trade from hand to stash
+    heat goes to the opponent with the most valuable open stash, steals to the one with the highest peddle
+    the mover is never a target, heat without an open market among the opponents goes to one without,
+    which just discards it
+    """
+    hand = engine._hand[r].astype(np.int64)
+    playable = np.take_along_axis(engine.playable(r), hand, axis=1)
+    stuck = ~playable.any(axis=1)
+    playable[stuck] = True
+    slots = np.where(playable, engine.preference[hand], -np.inf).argmax(axis=1)
+    kinds = hand[np.arange(len(r)), slots]
+
+    targets = np.zeros(len(r), dtype=np.int64)
+    heat = np.flatnonzero(np.isin(kinds, HN))
+    table = engine.table_rows(g[heat])
+    stashes = np.where(engine.market(table), engine._peddle_value[table], -1).astype(np.float64)
+    stashes[table == r[heat, None]] = -np.inf
+    targets[heat] = stashes.argmax(axis=1)
+    steal = np.flatnonzero(kinds == SN)
+    table = engine.table_rows(g[steal])
+    peddle = engine.highest_peddle(table)
+    highest = np.where(peddle >= 0, VALUES[peddle], -1).astype(np.float64)
+    highest[table == r[steal, None]] = -np.inf
+    targets[steal] = highest.argmax(axis=1)
+    return slots, targets
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from card import CARDS
+from zone import TYPE_KINDS
+
+if TYPE_CHECKING:
+    from action import Action, Offer
+    from player import Player
+
+### Offer Book:
+# the open offers of a round, indexed by author, target and the card kinds their actions involve
+# offers go from open to agreed, and end up accepted, rejected or retracted, which is kept on the offer itself
+# - agreeing keeps an offer open for later, when it isn't viable yet
+# - once the target of an offer finishes their turn without accepting or agreeing, it counts as rejected
+# - every author only has a limited number of offers open, posting more retracts the oldest
+# closed offers leave the book right away, their actions are still in the history of the round
+OPEN, AGREED, ACCEPTED, REJECTED, RETRACTED = "open", "agreed", "accepted", "rejected", "retracted"
+LIVE = (OPEN, AGREED)
+
+
+def action_kinds(action: Action) -> set[int]:
+    """ card kinds an action would move, type only actions involve every kind of the type """
+    kinds = set()
+    for ctype, cvalue in ((getattr(action, "card_type", None), getattr(action, "card_value", 0)),
+                          (getattr(action, "my_card_type", None), 0),
+                          (getattr(action, "your_card_type", None), 0)):
+        if ctype is None:
+            continue
+        card = CARDS.get((ctype, cvalue))
+        if cvalue and card:
+            kinds.add(card.kind)
+        else:
+            kinds.update(TYPE_KINDS[ctype])
+    if hasattr(action, "cvalue") and action.cvalue:
+        kinds.add(CARDS["pd", action.cvalue].kind)
+    for nested in getattr(action, "actions", ()):
+        kinds |= action_kinds(nested)
+    return kinds
+
+
+class OfferBook:
+    """ the open offers of a table, so finding the offers of a player never scans the whole history """
+
+    def __init__(self, limit: int = 8):
+        self.limit = limit
+        self.next_id = 0
+        self.offers = {}
+        self.by_author = {}
+        self.by_target = {}
+        self.by_kind = {}
+        self.closed = Counter()
+
+    def __len__(self):
+        return len(self.offers)
+
+    def clear(self):
+        self.offers.clear()
+        self.by_author.clear()
+        self.by_target.clear()
+        self.by_kind.clear()
+
+    def post(self, offer: Offer):
+        """ puts up a new open offer """
+        offer.id = self.next_id
+        self.next_id += 1
+        offer.status = OPEN
+        offer.kinds = action_kinds(offer)
+        self.offers[offer.id] = offer
+        # dicts keep the order offers were posted in
+        self.by_author.setdefault(id(offer.player), {})[offer.id] = offer
+        self.by_target.setdefault(id(offer.target), {})[offer.id] = offer
+        for kind in offer.kinds:
+            self.by_kind.setdefault(kind, {})[offer.id] = offer
+        authored = self.by_author[id(offer.player)]
+        if len(authored) > self.limit:
+            self.close(next(iter(authored.values())), RETRACTED)
+
+    def agree(self, offer: Offer):
+        if offer.status == OPEN:
+            offer.status = AGREED
+
+    def close(self, offer: Offer, status: str):
+        """ takes an offer out of the book for good """
+        if offer.status not in LIVE or offer.id not in self.offers:
+            return
+        offer.status = status
+        self.closed[status] += 1
+        del self.offers[offer.id]
+        for index, key in ((self.by_author, id(offer.player)), (self.by_target, id(offer.target))):
+            del index[key][offer.id]
+            if not index[key]:
+                del index[key]
+        for kind in offer.kinds:
+            del self.by_kind[kind][offer.id]
+            if not self.by_kind[kind]:
+                del self.by_kind[kind]
+
+    def end_turn(self, player: Player):
+        """ offers to the player that weren't accepted or agreed on during their turn are rejected """
+        targeted = self.by_target.get(id(player))
+        if targeted:
+            for offer in [offer for offer in targeted.values() if offer.status == OPEN]:
+                self.close(offer, REJECTED)
+
+    def authored(self, player: Player) -> list[Offer]:
+        return list(self.by_author.get(id(player), {}).values())
+
+    def targeting(self, player: Player) -> list[Offer]:
+        return list(self.by_target.get(id(player), {}).values())
+
+    def involving(self, kind: int) -> list[Offer]:
+        """ live offers that would move a card of the kind """
+        return list(self.by_kind.get(kind, {}).values())
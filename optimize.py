@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from behaviour import naive_eval
+from evaluation import Greedy
+from runner import play_chunk, behaviour_factory, game_seed
+from tournament import Variant
+
+### Optimizer:
+# tunes a concept value table (see behaviour.naive_eval) by CMA-ES, the table is a parameter vector of its
+# entries in units of SCALE, every entry of the starting table is a parameter, nothing else
+# - fitness of a table is simulated play: the behaviour with the table sits at every seat in turn against fixed
+#   opponents, a game scores the own final score minus the mean of the others, over SCALE * 10, averaged
+# - every generation plays all candidates on the same new game seeds (common random numbers), so candidates
+#   are compared on the same deals, and the best table so far is played on them as well:
+#   its fitness is the mean over all generations it took part in, and it is only replaced by a candidate
+#   that did better on the very same games, that keeps lucky draws from being taken for the best table
+# - all games of a generation are one flat list of tasks for the worker pool, so all cores stay busy
+# - the whole state is written to a json checkpoint after every generation, runs can be resumed from it,
+#   and it always holds the best table found so far
+# the CMA-ES updates follow Hansen's tutorial (arXiv:1604.00772), maximizing instead of minimizing
+SCALE = 10000
+
+
+def parameters(values: dict) -> list[tuple[str, str]]:
+    """ the (part, concept) of every entry of a table, in a fixed order """
+    return [(part, name) for part in sorted(values) for name in sorted(values[part])]
+
+
+def to_vector(values: dict, keys: list[tuple[str, str]]) -> np.ndarray:
+    return np.array([values[part][name] / SCALE for part, name in keys])
+
+
+def to_table(vector: np.ndarray, keys: list[tuple[str, str]]) -> dict:
+    table = {}
+    for (part, name), value in zip(keys, vector):
+        table.setdefault(part, {})[name] = int(round(value * SCALE))
+    return table
+
+
+def play_seat(task: tuple) -> float:
+    """ worker entry point, the fitness of the table at the first seat of a chunk of games """
+    factories, seat, games, rounds, seed = task
+    # the candidate sits at the seat, the others keep their order
+    factories = factories[1:seat + 1] + factories[:1] + factories[seat + 1:]
+    result = play_chunk((factories, games, rounds, seed, False))
+    others = sum(result.scores) - result.scores[seat]
+    return (result.scores[seat] - others / (len(factories) - 1)) / (SCALE * 10) / games
+
+
+class CMAES:
+    """ the state of a CMA-ES search over n parameters, everything but the random generator is plain numbers """
+
+    def __init__(self, mean: np.ndarray, sigma: float, population: int = None, seed: int = None):
+        n = len(mean)
+        self.n = n
+        self.population = population or 4 + int(3 * np.log(n))
+        mu = self.population // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / (self.weights ** 2).sum()
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0.0, np.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+        self.mean = np.array(mean, dtype=np.float64)
+        self.sigma = sigma
+        self.cov = np.eye(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.generation = 0
+        self.rng = np.random.default_rng(seed)
+
+    def ask(self) -> np.ndarray:
+        """ a new population, one candidate per row """
+        values, vectors = np.linalg.eigh(self.cov)
+        scale = vectors * np.sqrt(np.maximum(values, 1e-20))
+        steps = self.rng.standard_normal((self.population, self.n)) @ scale.T
+        return self.mean + self.sigma * steps
+
+    def tell(self, candidates: np.ndarray, fitness: np.ndarray):
+        """ moves the search towards the candidates with the highest fitness """
+        n = self.n
+        mu = len(self.weights)
+        order = np.argsort(-fitness)[:mu]
+        steps = (candidates[order] - self.mean) / self.sigma
+        step = self.weights @ steps
+        self.mean = self.mean + self.sigma * step
+
+        values, vectors = np.linalg.eigh(self.cov)
+        inverse_root = vectors @ np.diag(1 / np.sqrt(np.maximum(values, 1e-20))) @ vectors.T
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * self.mueff) * inverse_root @ step
+        self.generation += 1
+        ps_norm = np.linalg.norm(self.ps)
+        hsig = ps_norm / np.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2 - self.cc) * self.mueff) * step
+        rank_mu = (steps.T * self.weights) @ steps
+        self.cov = (1 - self.c1 - self.cmu) * self.cov + self.cmu * rank_mu + \
+            self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.cov)
+        self.sigma *= np.exp(self.cs / self.damps * (ps_norm / self.chi - 1))
+
+    def state(self) -> dict:
+        return {"mean": self.mean.tolist(), "sigma": self.sigma, "cov": self.cov.tolist(), "pc": self.pc.tolist(),
+                "ps": self.ps.tolist(), "generation": self.generation, "population": self.population,
+                "rng": self.rng.bit_generator.state}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "CMAES":
+        search = cls(np.array(state["mean"]), state["sigma"], state["population"])
+        search.cov = np.array(state["cov"])
+        search.pc = np.array(state["pc"])
+        search.ps = np.array(state["ps"])
+        search.generation = state["generation"]
+        search.rng.bit_generator.state = state["rng"]
+        return search
+
+
+class Optimizer:
+    """
+    Tunes the concept values of a behaviour (Greedy by default, which plays by them) against fixed opponents
+    games is the number of games per seat and candidate in every generation, more games average out more noise
+    """
+
+    def __init__(self, values: dict = naive_eval, behaviour=Greedy, opponents: list = None, games: int = 8,
+                 rounds: int = 1, sigma: float = 1.0, population: int = None, seed: int = 0):
+        self.keys = parameters(values)
+        self.behaviour = behaviour
+        self.opponents = opponents or [Variant(behaviour, name="start", values=values)] * 3
+        self.games = games
+        self.rounds = rounds
+        self.seed = seed
+        self.search = CMAES(to_vector(values, self.keys), sigma, population, seed)
+        self.best = to_vector(values, self.keys)
+        self.best_fitness = 0.0
+        self.best_games = 0
+        self.evaluations = 0
+        self.history = []
+
+    def tasks(self, vector: np.ndarray, generation: int) -> list[tuple]:
+        """ the games of a candidate in a generation, every candidate of a generation plays the same seeds """
+        factories = [Variant(self.behaviour, values=to_table(vector, self.keys))] + list(self.opponents)
+        # every seat plays its own run of game seeds, see runner.play_chunk
+        first = game_seed(self.seed, generation) * len(factories)
+        return [(factories, seat, self.games, self.rounds, (first + seat) * self.games)
+                for seat in range(len(factories))]
+
+    def evaluate(self, candidates: np.ndarray, pool) -> np.ndarray:
+        """ the fitness of every candidate, on the games of the current generation """
+        generation = self.search.generation
+        tasks = [task for vector in candidates for task in self.tasks(vector, generation)]
+        results = np.array(list(pool.imap(play_seat, tasks) if pool else map(play_seat, tasks)))
+        self.evaluations += len(tasks) * self.games
+        return results.reshape(len(candidates), -1).mean(axis=1)
+
+    def step(self, pool=None) -> dict:
+        """ one generation: the population and the best table so far play the same games """
+        candidates = self.search.ask()
+        fitness = self.evaluate(np.vstack([candidates, self.best]), pool)
+        fitness, incumbent = fitness[:-1], fitness[-1]
+        self.search.tell(candidates, fitness)
+        # the best table so far averages its fitness over every generation it played in
+        self.best_fitness = (self.best_fitness * self.best_games + incumbent) / (self.best_games + 1)
+        self.best_games += 1
+        leader = int(np.argmax(fitness))
+        if fitness[leader] > incumbent:
+            self.best = candidates[leader]
+            self.best_fitness = fitness[leader]
+            self.best_games = 1
+        report = {"generation": self.search.generation, "evaluations": self.evaluations,
+                  "mean_fitness": float(fitness.mean()), "top_fitness": float(fitness[leader]),
+                  "best_fitness": float(self.best_fitness), "best_generations": self.best_games,
+                  "sigma": float(self.search.sigma)}
+        self.history.append(report)
+        return report
+
+    def best_table(self) -> dict:
+        return to_table(self.best, self.keys)
+
+    def save(self, path: str):
+        state = {"keys": self.keys, "games": self.games, "rounds": self.rounds, "seed": self.seed,
+                 "search": self.search.state(), "best": self.best.tolist(), "best_fitness": self.best_fitness,
+                 "best_games": self.best_games, "evaluations": self.evaluations, "history": self.history,
+                 "best_table": self.best_table()}
+        # written next to the checkpoint first, so a run stopped while saving keeps the last one
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path: str):
+        with open(path) as f:
+            state = json.load(f)
+        self.keys = [tuple(key) for key in state["keys"]]
+        self.games = state["games"]
+        self.rounds = state["rounds"]
+        self.seed = state["seed"]
+        self.search = CMAES.from_state(state["search"])
+        self.best = np.array(state["best"])
+        self.best_fitness = state["best_fitness"]
+        self.best_games = state["best_games"]
+        self.evaluations = state["evaluations"]
+        self.history = state["history"]
+
+    def run(self, generations: int, workers: int = None, checkpoint: str = None, log=None) -> dict:
+        workers = workers or os.cpu_count() or 1
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            for g in range(generations):
+                start = time.perf_counter()
+                report = self.step(pool)
+                if checkpoint:
+                    self.save(checkpoint)
+                if log:
+                    print(json.dumps({**report, "seconds": round(time.perf_counter() - start, 2)}), file=log,
+                          flush=True)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return self.best_table()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Tune concept values by CMA-ES over simulated games")
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--behaviour", type=behaviour_factory, default=Greedy,
+                        help="behaviour class that plays by the tuned concept values")
+    parser.add_argument("--opponents", type=behaviour_factory, nargs="+", default=None,
+                        help="behaviour class names of the other seats, default the behaviour with the start table")
+    parser.add_argument("--games", type=int, default=8, help="games per seat and candidate in every generation")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--sigma", type=float, default=1.0, help=f"initial step size, in units of {SCALE}")
+    parser.add_argument("--population", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to all cores")
+    parser.add_argument("--checkpoint", default=None, help="json file the state is saved to after every generation")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs the --checkpoint to continue from")
+
+    optimizer = Optimizer(behaviour=args.behaviour, opponents=args.opponents, games=args.games, rounds=args.rounds,
+                          sigma=args.sigma, population=args.population, seed=args.seed)
+    if args.resume:
+        optimizer.load(args.checkpoint)
+    best = optimizer.run(args.generations, args.workers, args.checkpoint, log=sys.stderr)
+    print(json.dumps(best, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,148 +1,107 @@
+from __future__ import annotations
+
 import random
+from typing import TYPE_CHECKING
 
 from card import Card
 from behaviour import *
+from protection import solve_protection, PEDDLE_VALUES
 from thinking import Thinking
+from zone import Zone, SHARED_RANDOM
 from action import *
 
+if TYPE_CHECKING:
+    from grass import Grass
+
 
 class Player:
     """
     Everything that the player manages is in this class
     That includes the players believes, knowledge the player has and its values
     The player also manages its own side of the board
+    Every random choice of the player draws from rng, the random module itself unless the table seeds the seat
     """
 
-    def __init__(self, name, behaviour: Behaviour):
+    def __init__(self, name, behaviour: Behaviour, rng: random.Random = SHARED_RANDOM):
         self.name = name
         self.behaviour = behaviour
+        self.rng = rng
         self.skips = 0
-        self.hassle = []
-        self.stash = []
-        self.hand = []
+        self.hassle = Zone()
+        self.stash = Zone()
+        self.hand = Zone()
         self.knowledge_base = Thinking(self)
         self.score = 0
 
+    def clone(self) -> Player:
+        """
+        copies the table side and hand of the player for lookahead,
+        behaviour and knowledge base are shared with the original player
+        """
+        player = Player.__new__(Player)
+        player.name = self.name
+        player.behaviour = self.behaviour
+        player.rng = self.rng
+        player.skips = self.skips
+        player.hassle = self.hassle.copy()
+        player.stash = self.stash.copy()
+        player.hand = self.hand.copy()
+        player.knowledge_base = self.knowledge_base
+        player.score = self.score
+        return player
+
     def eval_self(self) -> dict:
         """ adds up card values over the stash and hand of a player, regardless of the banker """
-        # evaluate stash
-        protected = 0
-        stash = 0
-        for c in self.stash:
-            if c.type == "pd":
-                stash += c.value
-            elif c.type == "pr":
-                protected += c.value
-
-        # evaluate hand
-        hand = 0
-        for card in self.hand:
-            if card.type == "pd" or card.type[0] == 'd':
-                hand -= card.value
-
-        return {"protected": protected, "stash": stash, "hand": hand}
+        return {"protected": self.stash.total("pr"), "stash": self.stash.total("pd"),
+                "hand": -self.hand.total("pd", "ds", "dc", "du")}
 
     def take_hand_card(self, ctype: str, cvalue: int = 0) -> Card:
         """ take one card from hand, removes it """
-        for i, c in enumerate(self.hand):
-            if c.type == ctype:
-                if cvalue:
-                    if c.value == cvalue:
-                        return self.hand.pop(i)
-                else:
-                    return self.hand.pop(i)
+        return self.hand.take(ctype, cvalue)
 
     def check_hand_card(self, ctype, cvalue: int = 0) -> Card:
         """ check, if hand contains card of specified type """
-        for c in self.hand:
-            if c.type == ctype:
-                if cvalue:
-                    if c.value == cvalue:
-                        return c
-                else:
-                    return c
+        return self.hand.find(ctype, cvalue)
 
     def highest_stashed_peddle_value(self) -> int:
         """ return highest peddle value, else return 0"""
-        highest = 0
-        peddles = [pd.value for pd in self.stash if pd.type == "pd"]
-        if peddles:
-            highest = max(peddles)
-        return highest
+        return self.stash.highest_peddle()
 
     def lowest_stashed_peddle_value(self) -> int:
         """ return lowest peddle value, else return 0"""
-        lowest = 0
-        peddles = [pd.value for pd in self.stash if pd.type == "pd"]
-        if peddles:
-            lowest = min(peddles)
-        return lowest
+        return self.stash.lowest_peddle()
 
     def take_lowest_stash_card(self) -> Card:
         """ take lowest peddle from stash, removes it """
-        lowest = 200000
-        lowest_idx = -1
-        for i, c in enumerate(self.stash):
-            if c.type == "pd" and c.value < lowest:
-                lowest_idx = i
-                lowest = c.value
-        if lowest_idx >= 0:
-            return self.stash.pop(lowest_idx)
+        return self.stash.take("pd", self.stash.lowest_peddle())
 
     def take_highest_stash_card(self) -> Card:
         """ take highest peddle from stash, removes it """
-        highest = 0
-        highest_idx = -1
-        for i, c in enumerate(self.stash):
-            if c.type == "pd" and c.value > highest:
-                highest_idx = i
-                highest = c.value
-        if highest_idx >= 0:
-            return self.stash.pop(highest_idx)
+        return self.stash.take("pd", self.stash.highest_peddle())
 
     def take_stash_card(self, value) -> Card:
         """ take specific stashed peddle card with defined value """
-        for i, c in enumerate(self.stash):
-            if c.type == "pd" and c.value == value:
-                return self.stash.pop(i)
+        if value:
+            return self.stash.take("pd", value)
 
     def check_stash_card(self, ctype: str, value=0) -> Card:
         """ check, if stash contains card of specified type """
-        for c in self.stash:
-            if c.type == ctype:
-                if value:
-                    if c.value == value:
-                        return c
-                else:
-                    return c
+        return self.stash.find(ctype, value)
 
     def check_stash_for_protection(self, value) -> list[int]:
         """
-        check stash for combination of peddle cards for protection, then return their indexes
-        always try to find as little amount of cards to be protected as possible
+        check stash for combination of peddle cards for protection, then return their values
+        always finds the least amount of cards to be protected, if there is any combination
         """
-        peddle = []
-        for i, c in enumerate(self.stash):
-            if c.type == "pd":
-                peddle.append((i, c))
-        sorted_peddle = sorted(peddle, key=lambda el: el[1].value, reverse=True)
-        collected_peddle = []
-        found_combination = False
-        for c in sorted_peddle:
-            if c[1].value > value:
-                continue
-            else:
-                collected_peddle.append(c)
-                if sum(el[1].value for el in collected_peddle) == value:
-                    found_combination = True
-                    break
-        if found_combination:
-            return [el[0] for el in collected_peddle]
+        combination = solve_protection(self.stash.peddle_counts(), value)
+        if combination:
+            return [peddle for peddle, count in zip(PEDDLE_VALUES, combination) for i in range(count)]
 
     def heated(self) -> int:
         """ check how the market is heated, returns type of heat """
-        if self.hassle and self.hassle[-1].type == "hn":
-            return self.hassle[-1].value
+        top = self.hassle.top()
+        if top and top.type == "hn":
+            return top.value
 
     # what would the player do when it is their turn
     def move(self, game: Grass):
@@ -175,29 +134,41 @@ class Player:
         # TODO implement trading (in progress)
         self.trade()
 
-        # play a card
-        # TODO play best evaluated card
-        c = random.choice(self.hand)
+        # play a card, the behaviour may choose it, else a random one is played
+        play = self.behaviour.choose_play(self, game)
+        if play is None:
+            play = self.random_play(game)
+        if play is not None:
+            game.handle_action(play)
+        return True
+
+    def random_play(self, game: Grass) -> PlayCard:
+        """ plays a random hand card on random targets, but keeps the banker and unplayable market close cards """
+        if all(c.type == "ba" or (c.type == "mc" and not c.playable(self)) for c in self.hand):
+            # nothing else to play, so one of them has to go
+            c = self.rng.choice(self.hand)
+            return PlayCard(self, c.type, [game] if c.type == "ba" else [self, game], c.value)
+        c = self.rng.choice(self.hand)
         while c.type in ["ba", "mc"]:
-            c = random.choice(self.hand)
+            c = self.rng.choice(self.hand)
             if c.type == "mc" and c.playable(self):
                 break
 
         if c.type in ["mc", "mo", "pd", "hf", "st", "eu", "ds", "dc", "du", "pr"]:
-            game.handle_action(PlayCard(self, c.type, [self, game]))
+            return PlayCard(self, c.type, [self, game], c.value)
         elif c.type == "hn":
-            rand_player = random.choice(game.players)
+            rand_player = self.rng.choice(game.players)
             while rand_player is self:
-                rand_player = random.choice(game.players)
-            game.handle_action(PlayCard(self, c.type, [game, rand_player]))
+                rand_player = self.rng.choice(game.players)
+            return PlayCard(self, c.type, [game, rand_player], c.value)
         elif c.type == "pf":
-            game.handle_action(PlayCard(self, c.type, [self, game, self.lowest_stashed_peddle_value()]))
+            return PlayCard(self, c.type, [self, game, self.lowest_stashed_peddle_value()], c.value)
         elif c.type == "sn":
-            rand_player = random.choice(game.players)
+            rand_player = self.rng.choice(game.players)
             while rand_player is self:
-                rand_player = random.choice(game.players)
-            game.handle_action(PlayCard(self, c.type, [self, game, rand_player, rand_player.highest_stashed_peddle_value()]))
-        return True
+                rand_player = self.rng.choice(game.players)
+            cvalue = rand_player.highest_stashed_peddle_value()
+            return PlayCard(self, c.type, [self, game, rand_player, cvalue], c.value)
 
     # offer or accept trades
     def trade(self):
@@ -217,9 +188,9 @@ class Player:
         # TODO implement card trading options
         return False
 
-    # send a card to the player left of you before knowing the card receiving, popping that card from the hand
-    def send_card_left(self):
+    # choose a card to send to the player left of you before knowing the card receiving
+    def send_card_left(self) -> Card:
         # send any negative cards left, else the one with the minimum value
         # TODO choose good card left when paranoia cards are played based on policy
-        c = random.choice(self.hand)
-        return False
+        if self.hand:
+            return self.rng.choice(self.hand)
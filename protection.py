@@ -0,0 +1,44 @@
+from functools import lru_cache
+
+from card import CARD_KINDS
+from zone import TYPE_KINDS
+
+# peddle denominations in the order of Zone.peddle_counts()
+PEDDLE_VALUES = tuple(CARD_KINDS[kind].value for kind in TYPE_KINDS["pd"])
+
+
+def solve_protection(counts: tuple[int, ...], value: int) -> tuple[int, ...] | None:
+    """
+    find the fewest peddle cards that exactly add up to the value, out of the held counts per denomination
+    returns how many cards of every denomination to use, else None
+    from all combinations with the fewest cards, the one using the most high denominations is chosen
+    """
+    # more cards of a denomination than fit into the value never matter, which makes the memo hit more often
+    return _solve(tuple(min(count, value // peddle) for count, peddle in zip(counts, PEDDLE_VALUES)), value)
+
+
+@lru_cache(maxsize=4096)
+def _solve(counts: tuple[int, ...], value: int) -> tuple[int, ...] | None:
+    best = None
+    best_cards = 0
+    # denominations from high to low, and for each the most cards first, so ties keep the first solution found
+    order = sorted(range(len(counts)), key=lambda i: PEDDLE_VALUES[i], reverse=True)
+    used = [0] * len(counts)
+
+    def search(position: int, remaining: int, cards: int):
+        nonlocal best, best_cards
+        if best is not None and cards >= best_cards:
+            return
+        if remaining == 0:
+            best, best_cards = tuple(used), cards
+            return
+        if position == len(order):
+            return
+        i = order[position]
+        for k in range(min(counts[i], remaining // PEDDLE_VALUES[i]), -1, -1):
+            used[i] = k
+            search(position + 1, remaining - k * PEDDLE_VALUES[i], cards + k)
+        used[i] = 0
+
+    search(0, value, 0)
+    return best
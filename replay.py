@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from typing import TYPE_CHECKING
+
+from action import *
+from behaviour import Behaviour
+from card import CARD_KINDS
+from offers import ACCEPTED
+from zone import Zone, Pile, TYPE_KINDS
+
+if TYPE_CHECKING:
+    from grass import Grass
+    from player import Player
+
+### Action Records:
+# every action of a round is stored as a fixed width record of 8 int32 fields
+# [code, turn, seat, target, ctype, cvalue, ctype2, cvalue2]
+# - code: the action class, see ACTION_CODES
+# - turn: game turn the action happened in
+# - seat/target: seats of the acting and the targeted player, -1 without target
+# - ctype/cvalue: card type (index into CARD_TYPES) and value of the moved or played card
+# - ctype2/cvalue2: the second card of a trade, the peddle value named by pay fine or steal
+# offers store the number of records of their actions and threats in ctype/cvalue, those records follow
+# right after the offer, answers to an offer store the record index of the offer as target
+# together with the deck order at the start of a round, the records recreate the whole round
+RECORD_FIELDS = 8
+CARD_TYPES = list(TYPE_KINDS)
+ACTION_CODES = {Skip: 1, DrawCard: 2, PlayCard: 3, ShowCard: 4, CardTrade: 5, GivePeddle: 6, Offer: 7,
+                AgreeOffer: 8, AcceptOffer: 9, RejectOffer: 10, RetractOffer: 11, PassCard: 12}
+ACTIONS = {code: ac for ac, code in ACTION_CODES.items()}
+PILES = ["deck", "waste"]
+STATUSES = ["initializing", "setup", "playing", "closed", "cards ran out", "between rounds", "game over"]
+WASTE_STATUSES = ["discarded", "played"]
+
+# turns between two state checkpoints of a recording
+CHECKPOINT_INTERVAL = 50
+
+
+def snapshot(game: Grass) -> bytes:
+    """ packs the state of a round in between actions into bytes, all zones are stored as card kinds """
+    zones = [game.deck, game.waste, game.aside]
+    for pl in game.players:
+        zones.extend((pl.hand, pl.stash, pl.hassle))
+    header = [game.turn, game.turn_player, game.extra_turn, STATUSES.index(game.status),
+              WASTE_STATUSES.index(game.waste_status)]
+    header.extend(pl.skips for pl in game.players)
+    header.extend(len(zone) for zone in zones)
+    return array("i", header).tobytes() + bytes(c.kind for zone in zones for c in zone)
+
+
+def restore(game: Grass, state: bytes):
+    """ sets the round back to a snapshot of the same table """
+    players = len(game.players)
+    fields = 5 + players + 3 + 3 * players
+    header = array("i")
+    header.frombytes(state[:fields * header.itemsize])
+    kinds = state[fields * header.itemsize:]
+    game.turn, game.turn_player = header[0], header[1]
+    game.extra_turn = bool(header[2])
+    game.status = STATUSES[header[3]]
+    game.waste_status = WASTE_STATUSES[header[4]]
+    game.passing = False
+    for pl, skips in zip(game.players, header[5:5 + players]):
+        pl.skips = skips
+
+    piles = []
+    start = 0
+    for length in header[5 + players:]:
+        piles.append([CARD_KINDS[kind] for kind in kinds[start:start + length]])
+        start += length
+    game.deck, game.waste, game.aside = Pile(piles[0]), Zone(piles[1]), Zone(piles[2])
+    for i, pl in enumerate(game.players):
+        pl.hand, pl.stash, pl.hassle = (Zone(cards) for cards in piles[3 + 3 * i:6 + 3 * i])
+    if game.large:
+        game.track_zones()
+    if game.locations is not None:
+        game.locations.attach(game)
+
+
+class Recording:
+    """
+    The compact history of a single round: the deck order it started with and all actions as int records,
+    plus a snapshot of the state every few turns, so seeking to a late turn doesn't replay the whole round
+    """
+
+    def __init__(self, game: Grass, interval: int = CHECKPOINT_INTERVAL):
+        self.seats = {id(pl): seat for seat, pl in enumerate(game.players)}
+        self.players = len(game.players)
+        self.deck = bytes(c.kind for c in game.deck)
+        self.start = game.turn_player
+        self.records = array("i")
+        self.interval = interval
+        # checkpoints as (record index, turn, snapshot), ordered by turn
+        self.checkpoints = []
+        self.offers = {}
+        # filled in when the round is over
+        self.turns = 0
+        self.scores = [pl.score for pl in game.players]
+
+    @classmethod
+    def from_arrays(cls, deck: bytes, records: bytes, players: int, start: int, scores: list[float] = (),
+                    turns: int = 0) -> Recording:
+        """ a finished recording out of its raw parts, like stored by store.TrajectoryWriter """
+        recording = cls.__new__(cls)
+        recording.seats = {}
+        recording.players = players
+        recording.deck = deck
+        recording.start = start
+        recording.records = array("i")
+        recording.records.frombytes(records)
+        recording.interval = CHECKPOINT_INTERVAL
+        recording.checkpoints = []
+        recording.offers = {}
+        recording.turns = turns
+        recording.scores = list(scores)
+        return recording
+
+    def __len__(self):
+        return len(self.records) // RECORD_FIELDS
+
+    def record(self, index: int) -> array:
+        return self.records[index * RECORD_FIELDS:(index + 1) * RECORD_FIELDS]
+
+    def seat(self, player: Player) -> int:
+        return self.seats[id(player)] if player is not None else -1
+
+    def add(self, action: Action, turn: int):
+        """ encodes an action of the turn, nested offer actions are added right after their offer """
+        record = [ACTION_CODES[type(action)], turn, self.seat(action.player), -1, -1, 0, -1, 0]
+        nested = []
+        if isinstance(action, DrawCard):
+            record[4] = PILES.index(action.pile)
+        elif isinstance(action, (PlayCard, PassCard, ShowCard)):
+            record[4] = CARD_TYPES.index(action.card_type)
+            record[5] = getattr(action, "card_value", 0)
+            if isinstance(action, PassCard):
+                record[3] = self.seat(action.target)
+            elif isinstance(action, PlayCard):
+                record[3], record[7] = self.play_target(action)
+        elif isinstance(action, CardTrade):
+            record[3] = self.seat(action.target)
+            record[4] = CARD_TYPES.index(action.my_card_type)
+            record[6] = CARD_TYPES.index(action.your_card_type)
+        elif isinstance(action, GivePeddle):
+            record[3] = self.seat(action.target)
+            record[5] = action.cvalue
+        elif isinstance(action, Offer):
+            record[3] = self.seat(action.target)
+            record[4], record[5] = len(action.actions), len(action.threats)
+            self.offers[id(action)] = len(self)
+            nested = action.actions + action.threats
+        elif isinstance(action, (AgreeOffer, AcceptOffer, RejectOffer, RetractOffer)):
+            record[3] = self.offers.get(id(action.offer), -1)
+        self.records.extend(record)
+        for ac in nested:
+            self.add(ac, turn)
+
+    def play_target(self, action: PlayCard) -> tuple[int, int]:
+        """ the targeted seat and the named peddle value out of the arguments of a played card """
+        if action.card_type == "hn":
+            return self.seat(action.args[1]), 0
+        if action.card_type == "pf":
+            return -1, action.args[2] or 0
+        if action.card_type == "sn":
+            return self.seat(action.args[2]), action.args[3] or 0
+        return -1, 0
+
+    def checkpoint(self, game: Grass):
+        """ snapshots the state at a turn boundary, if the last checkpoint is long enough ago """
+        if not self.checkpoints or game.turn - self.checkpoints[-1][1] >= self.interval:
+            self.checkpoints.append((len(self), game.turn, snapshot(game)))
+
+    def finish(self, game: Grass):
+        """ notes the length of the round and what every seat scored in it """
+        self.turns = game.turn
+        self.scores = [pl.score - before for pl, before in zip(game.players, self.scores)]
+
+    def nbytes(self) -> int:
+        return len(self.deck) + self.records.itemsize * len(self.records) + sum(
+            len(state) for index, turn, state in self.checkpoints)
+
+
+class Replayer:
+    """
+    Rebuilds a recorded round on a table of its own, action by action
+    Actions are decoded back into the Action classes and their effects are applied directly,
+    so none of the behaviours or random choices of the players are involved
+    """
+
+    def __init__(self, recording: Recording, players: list[Player] = None):
+        from grass import Grass
+        from player import Player
+        if players is None:
+            players = [Player(f"seat {seat}", Behaviour()) for seat in range(recording.players)]
+        self.recording = recording
+        self.game = Grass(players)
+        self.position = 0
+        # decoded offers by their record index, so answers can refer to them
+        self.offers = {}
+        self.reset()
+
+    def reset(self):
+        """ back to the deal at the start of the round """
+        game = self.game
+        game.rounds = []
+        game.start_round([CARD_KINDS[kind] for kind in self.recording.deck])
+        game.turn_player = self.recording.start
+        self.position = 0
+        self.offers = {}
+
+    def decode(self, index: int) -> tuple[Action, int]:
+        """ the action of a record and the number of records it spans """
+        code, turn, seat, target, ctype, cvalue, ctype2, cvalue2 = self.recording.record(index)
+        game = self.game
+        player = game.players[seat]
+        target = game.players[target] if target >= 0 and code not in (8, 9, 10, 11) else None
+        ac = ACTIONS[code]
+        if ac is Skip:
+            return Skip(player), 1
+        if ac is DrawCard:
+            return DrawCard(player, PILES[ctype]), 1
+        if ac is PlayCard:
+            card_type = CARD_TYPES[ctype]
+            return PlayCard(player, card_type, self.play_args(player, card_type, target, cvalue2), cvalue), 1
+        if ac is ShowCard:
+            return ShowCard(player, CARD_TYPES[ctype]), 1
+        if ac is PassCard:
+            return PassCard(player, target, CARD_TYPES[ctype], cvalue), 1
+        if ac is CardTrade:
+            return CardTrade(player, target, CARD_TYPES[ctype], CARD_TYPES[ctype2]), 1
+        if ac is GivePeddle:
+            return GivePeddle(player, target, cvalue), 1
+        if ac is Offer:
+            actions, span = self.decode_nested(index + 1, ctype)
+            threats, threat_span = self.decode_nested(index + 1 + span, cvalue)
+            return Offer(player, target, actions, threats), 1 + span + threat_span
+        # answers to offers refer to them by record index, offers from before a restored checkpoint are unknown
+        return ac(player, self.offers.get(target)), 1
+
+    def decode_nested(self, index: int, count: int) -> tuple[list[Action], int]:
+        actions = []
+        span = 0
+        for i in range(count):
+            ac, length = self.decode(index + span)
+            actions.append(ac)
+            span += length
+        return actions, span
+
+    def play_args(self, player: Player, card_type: str, target: Player, cvalue: int) -> list:
+        """ the arguments of Card.play, the same way Player.move passes them """
+        game = self.game
+        if card_type == "hn":
+            return [game, target]
+        if card_type == "pf":
+            return [player, game, cvalue]
+        if card_type == "sn":
+            return [player, game, target, cvalue]
+        if card_type == "ba":
+            return [game]
+        return [player, game]
+
+    def step(self) -> bool:
+        """ applies the next recorded action, returns False at the end of the round """
+        if self.position >= len(self.recording):
+            return False
+        game = self.game
+        ac, span = self.decode(self.position)
+        code, turn, seat = self.recording.record(self.position)[:3]
+        # every turn starts with the turn player skipping or drawing
+        if isinstance(ac, (Skip, DrawCard)) and turn > game.turn:
+            game.turn_player = seat
+        game.turn = turn
+        if isinstance(ac, Offer):
+            self.offers[self.position] = ac
+            ac.effect(game)
+        elif isinstance(ac, AcceptOffer):
+            # the accepted actions are recorded on their own
+            if ac.offer is not None:
+                game.offers.close(ac.offer, ACCEPTED)
+        elif not isinstance(ac, (AgreeOffer, RejectOffer, RetractOffer)) or ac.offer is not None:
+            ac.effect(game)
+            # passing cards left is recorded on its own
+            game.passing = False
+        self.position += span
+        return True
+
+    def seek(self, turn: int):
+        """ state after the turn, starting from the last checkpoint before it """
+        recording = self.recording
+        i = bisect_right([t for index, t, state in recording.checkpoints], turn) - 1
+        if i >= 0 and (recording.checkpoints[i][1] > self.game.turn or self.game.turn > turn):
+            index, t, state = recording.checkpoints[i]
+            restore(self.game, state)
+            self.position = index
+        elif self.game.turn > turn:
+            self.reset()
+        records = recording.records
+        while self.position < len(recording) and records[self.position * RECORD_FIELDS + 1] <= turn:
+            self.step()
+        if self.position < len(recording):
+            self.game.turn_player = records[self.position * RECORD_FIELDS + 2]
+
+    def replay(self):
+        """ plays all remaining records """
+        while self.step():
+            pass
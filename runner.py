@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+from collections import Counter
+from multiprocessing import Pool
+from typing import Callable
+
+import behaviour
+import evaluation
+import ismcts
+from behaviour import Behaviour
+from grass import Grass
+from instrument import Instrumentation
+from player import Player
+
+
+class BatchResult:
+    """
+    Aggregated outcome of many simulated games, indexed by seat
+    Results of different chunks can be merged, so workers only ever send back these totals
+    """
+
+    def __init__(self, seats: int):
+        self.seats = seats
+        self.games = 0
+        self.rounds = 0
+        self.turns = 0
+        self.scores = [0.0] * seats
+        self.round_scores = [0.0] * seats
+        self.wins = [0] * seats
+        self.round_wins = [0] * seats
+        self.draws = 0
+        # whole games cut off after MAX_ROUNDS without a winner
+        self.unfinished = 0
+        self.round_lengths = Counter()
+        # what passed through handle_action, only if the batch was instrumented
+        self.instrumentation = None
+
+    def add_round(self, game: Grass, round_summary: list[float]):
+        """ collects a single scored round of a table """
+        self.rounds += 1
+        self.turns += game.turn
+        self.round_lengths[game.turn] += 1
+        for seat, result in enumerate(round_summary):
+            self.round_scores[seat] += result
+        best = max(round_summary)
+        leaders = [seat for seat, result in enumerate(round_summary) if result == best]
+        if len(leaders) == 1:
+            self.round_wins[leaders[0]] += 1
+
+    def add_game(self, game: Grass, winners: list[int] = None):
+        """
+        collects the final scores of a table, the highest score wins, a shared highest score is a draw
+        whole games pass the winners of Grass.play_game, without any the game was cut off and nobody wins
+        """
+        self.games += 1
+        final = [pl.score for pl in game.players]
+        for seat, score in enumerate(final):
+            self.scores[seat] += score
+        if winners is None:
+            best = max(final)
+            leaders = [seat for seat, score in enumerate(final) if score == best]
+        else:
+            leaders = winners
+        if not leaders:
+            self.unfinished += 1
+        elif len(leaders) == 1:
+            self.wins[leaders[0]] += 1
+        else:
+            self.draws += 1
+
+    def merge(self, other: "BatchResult"):
+        self.games += other.games
+        self.rounds += other.rounds
+        self.turns += other.turns
+        self.draws += other.draws
+        self.unfinished += other.unfinished
+        self.round_lengths.update(other.round_lengths)
+        if other.instrumentation is not None:
+            if self.instrumentation is None:
+                self.instrumentation = Instrumentation()
+            self.instrumentation.merge(other.instrumentation)
+        for seat in range(self.seats):
+            self.scores[seat] += other.scores[seat]
+            self.round_scores[seat] += other.round_scores[seat]
+            self.wins[seat] += other.wins[seat]
+            self.round_wins[seat] += other.round_wins[seat]
+        return self
+
+    def mean_round_length(self) -> float:
+        return self.turns / self.rounds if self.rounds else 0.0
+
+    def to_dict(self) -> dict:
+        result = {
+            "seats": self.seats,
+            "games": self.games,
+            "rounds": self.rounds,
+            "turns": self.turns,
+            "mean_round_length": self.mean_round_length(),
+            "scores": self.scores,
+            "round_scores": self.round_scores,
+            "wins": self.wins,
+            "round_wins": self.round_wins,
+            "draws": self.draws,
+            "unfinished": self.unfinished,
+            "round_lengths": {str(k): v for k, v in sorted(self.round_lengths.items())},
+        }
+        if self.instrumentation is not None:
+            result["instrumentation"] = self.instrumentation.to_dict()
+        return result
+
+
+def new_player(seat: int, factory: Callable) -> Player:
+    """ seat factories either build a whole Player or only its Behaviour """
+    made = factory()
+    if isinstance(made, Player):
+        return made
+    return Player(f"seat {seat}", made)
+
+
+def new_table(factories: list[Callable], seed=None) -> Grass:
+    return Grass([new_player(seat, factory) for seat, factory in enumerate(factories)], seed=seed)
+
+
+def play_chunk(task: tuple) -> BatchResult:
+    """
+    worker entry point, plays a chunk of games on fresh tables and only returns the totals
+    with a seed, the games of the chunk are seeded with seed, seed + 1, ... (see the random streams of Grass)
+    """
+    factories, games, rounds, seed, instrument = task
+    result = BatchResult(len(factories))
+    if instrument:
+        result.instrumentation = Instrumentation()
+    for g in range(games):
+        game = new_table(factories, None if seed is None else seed + g)
+        if instrument:
+            result.instrumentation.attach(game)
+        if not rounds:
+            # whole games, without keeping the history of rounds already counted
+            result.add_game(game, game.play_game(keep_rounds=0, on_round=result.add_round))
+            continue
+        for r in range(rounds):
+            scores_before = [pl.score for pl in game.players]
+            game.play_round()
+            result.add_round(game, [pl.score - before for pl, before in zip(game.players, scores_before)])
+        result.add_game(game)
+    return result
+
+
+def game_seed(seed: int, number: int) -> int:
+    """ the seed of a game of a seeded batch, the games of a chunk follow on with the next numbers """
+    return seed * 1000003 + number
+
+
+def split_chunks(games: int, chunk_size: int) -> list[int]:
+    chunks = [chunk_size] * (games // chunk_size)
+    if games % chunk_size:
+        chunks.append(games % chunk_size)
+    return chunks
+
+
+def play_batch(factories: list[Callable], games: int, rounds: int = 1, workers: int = None,
+               chunk_size: int = None, seed: int = None, instrument: bool = False) -> BatchResult:
+    """
+    Plays a number of games with a fixed number of rounds each (or whole games with 0 rounds),
+    spread over a pool of worker processes
+    Every seat is given as a factory (a Behaviour class works), so every table starts with fresh players
+    Factories need to be picklable, so use module level classes or functions instead of lambdas
+    Games are handed out in chunks to keep the pickling overhead per game low,
+    by default every worker gets about four chunks to balance uneven round lengths
+    With a seed, every game is seeded by its number in the batch, so results don't depend on the scheduling
+    or the chunk size, and any single game can be played again with new_table(factories, game_seed(seed, number))
+    With instrument, every table is instrumented (see instrument.py) and the counters are added up as well
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-games // (workers * 4)))
+    chunks = split_chunks(games, chunk_size)
+    starts = [sum(chunks[:i]) for i in range(len(chunks))]
+    tasks = [(factories, size, rounds, None if seed is None else game_seed(seed, start), instrument)
+             for start, size in zip(starts, chunks)]
+
+    result = BatchResult(len(factories))
+    if workers == 1:
+        for task in tasks:
+            result.merge(play_chunk(task))
+    else:
+        with Pool(workers) as pool:
+            for partial in pool.imap_unordered(play_chunk, tasks):
+                result.merge(partial)
+    return result
+
+
+def behaviour_factory(name: str) -> type[Behaviour]:
+    factory = getattr(behaviour, name, None) or getattr(ismcts, name, None) or getattr(evaluation, name, None)
+    if not (isinstance(factory, type) and issubclass(factory, Behaviour)):
+        raise argparse.ArgumentTypeError(f"unknown behaviour '{name}'")
+    return factory
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Simulate many games of Grass in parallel")
+    parser.add_argument("--games", type=int, default=1000, help="number of tables to play")
+    parser.add_argument("--rounds", type=int, default=1,
+                        help="rounds played on every table, 0 plays whole games until a score passes 250k")
+    parser.add_argument("--players", type=int, default=6, help="seats per table")
+    parser.add_argument("--behaviour", type=behaviour_factory, nargs="+", default=[behaviour.SimpleMinded],
+                        help="behaviour class names, cycled over the seats")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to all cores")
+    parser.add_argument("--chunk-size", type=int, default=None, help="games per worker task")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--instrument", action="store_true", help="count and time every action and card type")
+    args = parser.parse_args(argv)
+
+    factories = [args.behaviour[seat % len(args.behaviour)] for seat in range(args.players)]
+    result = play_batch(factories, args.games, args.rounds, args.workers, args.chunk_size, args.seed,
+                        args.instrument)
+    print(json.dumps(result.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+
+from behaviour import Behaviour
+from engine import Agent, AsyncTable, BehaviourAgent, public_view
+from grass import Grass, MAX_ROUNDS
+from player import Player
+from runner import behaviour_factory
+from thinking import Thinking
+
+### Game Server:
+# hosts many tables of the async engine (see engine.py) in one process, for bot-vs-bot and human-vs-bot play
+# clients talk newline delimited json over a local TCP or Unix socket, every request is one object with an "op",
+# and an optional "id" that its reply carries back, replies are {"ok": true, ...} or {"ok": false, "error": ...}:
+#   {"op": "create", "seats": ["SimpleMinded", null, ...], "seed": 1, "rounds": 1, "deadline": 1.0}
+#       a new table, named behaviours play on the server, null seats are for clients to join,
+#       the table starts once every null seat is taken, replies {"table": id}
+#       the game ends once a score passes the winning score or after rounds rounds, rounds 0 means MAX_ROUNDS
+#       optional: "trades": false never asks client seats to trade, "threaded": true lets slow behaviours
+#       choose in worker threads
+#   {"op": "join", "table": id, "seat": seat}   takes a free client seat for this connection
+#   {"op": "state", "table": id}   the public state of a table (engine.public_view)
+#   {"op": "tables"}   every table with its status, and how many tables were played and reused
+#   {"op": "close", "table": id}   stops a table, replies once it is gone
+# the seats of a connection get their decisions as events, and answer them with act, which gets no reply:
+#   {"event": "decide", "table": id, "seat": seat, "request": n, "observation": {...}}
+#   {"op": "act", "table": id, "seat": seat, "request": n, "answer": ...}
+# answers are the ones of engine.py, they are checked by AsyncTable and applied through Grass.handle_action,
+# so a client can't do anything the rules don't allow, late answers are dropped and the fallback plays
+# connections seated at a table also get {"event": "round", "table": id, "round": n, "scores": [...]}
+# after every round and {"event": "finished", "table": id, "scores": [...], "winners": [...], "winner": name}
+# at the end, just like Grass.play_game: no winners and winner "none" if the game was cut off, "draw" for a tie
+# finished tables go back to a pool by number of seats, and new tables reset one from there (see Grass.reset),
+# so a busy server doesn't build tables, players, zones and knowledge bases for every game
+# closing a connection doesn't stop its tables, its seats are played by the fallback until they are joined again
+
+
+class TablePool:
+    """ finished tables by number of seats, handed out again for new games """
+
+    def __init__(self, limit: int = 1024):
+        self.limit = limit
+        self.free = {}
+        self.size = 0
+        self.built = 0
+        self.reused = 0
+
+    def acquire(self, behaviours: list[Behaviour], seed=None) -> Grass:
+        """ a table for a new game with the behaviours in seat order, reset from the pool if there is one """
+        free = self.free.get(len(behaviours))
+        if not free:
+            self.built += 1
+            return Grass([Player(f"seat {seat}", made) for seat, made in enumerate(behaviours)], seed=seed)
+        game = free.pop()
+        self.size -= 1
+        self.reused += 1
+        for pl, made in zip(game.players, behaviours):
+            pl.behaviour = made
+            pl.knowledge_base = Thinking(pl)
+        game.reset(seed)
+        return game
+
+    def release(self, game: Grass):
+        if self.size < self.limit:
+            self.free.setdefault(len(game.players), []).append(game)
+            self.size += 1
+
+
+class RemoteAgent(Agent):
+    """ a seat played by a client, every decision is sent as an event and waits for the act of the client """
+
+    def __init__(self, table: int, seat: int, trades: bool = True):
+        self.table = table
+        self.seat = seat
+        self.trades = trades
+        self.connection = None
+        self.requests = 0
+        self.pending = {}
+
+    async def act(self, observation: dict):
+        if self.connection is None:
+            raise ConnectionError("nobody plays the seat")
+        self.requests += 1
+        request = self.requests
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request] = future
+        self.connection.send({"event": "decide", "table": self.table, "seat": self.seat, "request": request,
+                              "observation": observation})
+        try:
+            return await future
+        finally:
+            del self.pending[request]
+
+    def answer(self, request: int, answer):
+        future = self.pending.get(request)
+        if future is not None and not future.done():
+            future.set_result(answer)
+
+    def leave(self):
+        """ the client is gone, decisions it still owes fail right away """
+        self.connection = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("the client left"))
+
+
+class Table:
+    """ a table hosted by the server, with the agents of its seats """
+
+    def __init__(self, server: GameServer, id: int, game: Grass, agents: list[Agent], rounds: int,
+                 deadline: float):
+        self.server = server
+        self.id = id
+        self.game = game
+        self.engine = AsyncTable(game, agents, deadline)
+        self.remote = {seat: agent for seat, agent in enumerate(agents) if isinstance(agent, RemoteAgent)}
+        self.rounds = rounds
+        self.task = None
+
+    def free_seats(self) -> list[int]:
+        return [seat for seat, agent in self.remote.items() if agent.connection is None]
+
+    def connections(self) -> set[Connection]:
+        return {agent.connection for agent in self.remote.values() if agent.connection is not None}
+
+    def broadcast(self, message: dict):
+        for connection in self.connections():
+            connection.send(message)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def round_played(self, game: Grass, round_summary: list[float]):
+        self.broadcast({"event": "round", "table": self.id, "round": game.round, "scores": round_summary})
+
+    async def run(self):
+        game = self.game
+        try:
+            winners = await self.engine.play_game(keep_rounds=0, on_round=self.round_played,
+                                                  max_rounds=self.rounds or MAX_ROUNDS)
+            self.broadcast({"event": "finished", "table": self.id, "scores": [pl.score for pl in game.players],
+                            "winners": winners, "winner": game.winner})
+        finally:
+            self.server.finish(self)
+
+
+class Connection:
+    """ a client of the server, every line it sends is one request """
+
+    def __init__(self, server: GameServer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.seats = []
+
+    def send(self, message: dict):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    async def serve(self):
+        try:
+            while line := await self.reader.readline():
+                request = {}
+                try:
+                    request = json.loads(line)
+                    reply = await self.server.handle(self, request)
+                except (ValueError, KeyError, TypeError, IndexError, argparse.ArgumentTypeError) as error:
+                    reply = {"ok": False, "error": str(error) or type(error).__name__}
+                if reply is not None:
+                    if isinstance(request, dict) and "id" in request:
+                        reply["id"] = request["id"]
+                    self.send(reply)
+                # only waits while the client doesn't read its events
+                await self.writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            for agent in self.seats:
+                if agent.connection is self:
+                    agent.leave()
+            self.writer.close()
+
+
+class GameServer:
+    """
+    Hosts tables for clients on a local socket, see the protocol above
+    deadline is the default time a client seat has for every decision, in seconds
+    """
+
+    def __init__(self, deadline: float = 1.0, pool: TablePool = None):
+        self.deadline = deadline
+        self.pool = pool or TablePool()
+        self.tables = {}
+        self.next_id = 0
+        self.finished = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, path: str = None) -> asyncio.Server:
+        """ listens on the Unix socket at path, or on the TCP port of host, port 0 picks a free one """
+        async def connected(reader, writer):
+            await Connection(self, reader, writer).serve()
+        if path is not None:
+            return await asyncio.start_unix_server(connected, path)
+        return await asyncio.start_server(connected, host, port)
+
+    def create_table(self, seats: list[str | None], seed=None, rounds: int = 1, deadline: float = None,
+                     trades: bool = True, threaded: bool = False) -> Table:
+        """ a new table, behaviour names play on the server, None seats wait for clients """
+        if len(seats) < 2:
+            raise ValueError("Grass needs at least two players")
+        behaviours = [Behaviour() if name is None else behaviour_factory(name)() for name in seats]
+        game = self.pool.acquire(behaviours, seed)
+        id = self.next_id
+        self.next_id += 1
+        agents = [BehaviourAgent(game, seat, threaded) if name is not None else RemoteAgent(id, seat, trades)
+                  for seat, name in enumerate(seats)]
+        table = self.tables[id] = Table(self, id, game, agents, rounds,
+                                        self.deadline if deadline is None else deadline)
+        if not table.remote:
+            table.start()
+        return table
+
+    def finish(self, table: Table):
+        if self.tables.pop(table.id, None) is not None:
+            self.finished += 1
+            for agent in table.remote.values():
+                agent.leave()
+            self.pool.release(table.game)
+
+    def table(self, request: dict) -> Table:
+        table = self.tables.get(request["table"])
+        if table is None:
+            raise KeyError(f"no table {request['table']}")
+        return table
+
+    async def handle(self, connection: Connection, request: dict) -> dict | None:
+        """ the reply to a request, None for requests without one """
+        op = request["op"]
+        if op == "act":
+            agent = self.table(request).remote.get(request["seat"])
+            if agent is not None and agent.connection is connection:
+                agent.answer(request["request"], request["answer"])
+            return None
+        if op == "create":
+            table = self.create_table(request["seats"], request.get("seed"), request.get("rounds", 1),
+                                      request.get("deadline"), request.get("trades", True),
+                                      request.get("threaded", False))
+            return {"ok": True, "table": table.id}
+        if op == "join":
+            table = self.table(request)
+            seat = request["seat"]
+            if seat not in table.free_seats():
+                raise ValueError(f"seat {seat} of table {table.id} isn't free")
+            agent = table.remote[seat]
+            agent.connection = connection
+            connection.seats.append(agent)
+            if not table.free_seats():
+                table.start()
+            return {"ok": True, "table": table.id, "seat": seat}
+        if op == "state":
+            table = self.table(request)
+            return {"ok": True, "table": table.id, "state": public_view(table.game),
+                    "free_seats": table.free_seats()}
+        if op == "tables":
+            return {"ok": True, "tables": {id: table.game.status for id, table in self.tables.items()},
+                    "finished": self.finished, "built": self.pool.built, "reused": self.pool.reused}
+        if op == "close":
+            table = self.table(request)
+            if table.task is not None:
+                table.task.cancel()
+                # the table is only gone once its task finished, which takes it off the tables
+                await asyncio.gather(table.task, return_exceptions=True)
+            else:
+                self.finish(table)
+            return {"ok": True, "table": table.id}
+        raise ValueError(f"unknown op '{op}'")
+
+
+class Client:
+    """ a connection to a GameServer from python, the joined seats are played by engine agents """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.replies = {}
+        self.agents = {}
+        self.results = {}
+        self.listener = asyncio.create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = None, path: str = None) -> Client:
+        if path is not None:
+            return cls(*await asyncio.open_unix_connection(path))
+        return cls(*await asyncio.open_connection(host, port))
+
+    def send(self, message: dict):
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    async def request(self, op: str, **fields) -> dict:
+        """ the reply of the server, failed requests raise a ValueError with the error of the server """
+        self.next_id += 1
+        reply = self.replies[self.next_id] = asyncio.get_running_loop().create_future()
+        self.send({"op": op, "id": self.next_id, **fields})
+        reply = await reply
+        if not reply["ok"]:
+            raise ValueError(reply["error"])
+        return reply
+
+    async def join(self, table: int, seat: int, agent: Agent) -> asyncio.Future:
+        """ plays the seat with the agent, returns the future of the finished event of the table """
+        self.agents[table, seat] = agent
+        result = self.results.setdefault(table, asyncio.get_running_loop().create_future())
+        await self.request("join", table=table, seat=seat)
+        return result
+
+    async def decide(self, event: dict):
+        answer = await self.agents[event["table"], event["seat"]].act(event["observation"])
+        self.send({"op": "act", "table": event["table"], "seat": event["seat"], "request": event["request"],
+                   "answer": answer})
+
+    async def listen(self):
+        while line := await self.reader.readline():
+            message = json.loads(line)
+            event = message.get("event")
+            if event == "decide":
+                asyncio.create_task(self.decide(message))
+            elif event == "finished":
+                result = self.results.get(message["table"])
+                if result is not None and not result.done():
+                    result.set_result(message)
+            elif event is None and message.get("id") in self.replies:
+                self.replies.pop(message["id"]).set_result(message)
+
+    async def close(self):
+        self.listener.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def serve(host: str, port: int, path: str = None, deadline: float = 1.0):
+    server = await GameServer(deadline).start(host, port, path)
+    for sock in server.sockets:
+        print(f"listening on {sock.getsockname()}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Host Grass tables for bots and people on a local socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", default=None, help="path of a Unix socket to listen on instead of TCP")
+    parser.add_argument("--deadline", type=float, default=1.0, help="seconds for every decision of a client seat")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.deadline))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import os
+from array import array
+
+import numpy as np
+
+from replay import Recording, RECORD_FIELDS, ACTION_CODES
+
+### Trajectory Store:
+# a directory of raw fixed width files, that only ever get appended to
+# - records.bin: all action records of all rounds as int32 rows of RECORD_FIELDS (see replay.py)
+# - decks.bin: the deck order of every round as uint8 card kinds
+# - scores.bin: the score every seat made in a round as float64
+# - index.bin: one int64 row per round with the offsets into the other files, see INDEX_FIELDS
+# the index row of a round is written last, so readers only ever see complete rounds,
+# even while a writer is still appending to the files
+# readers memory map the files, so nothing is loaded or deserialized before it is used
+INDEX_FIELDS = ["record_start", "records", "deck_start", "deck_size", "score_start", "players", "start_seat",
+                "turns"]
+RECORD_START, RECORDS, DECK_START, DECK_SIZE, SCORE_START, PLAYERS, START_SEAT, TURNS = range(len(INDEX_FIELDS))
+FILES = {"records": np.int32, "decks": np.uint8, "scores": np.float64, "index": np.int64}
+FORMAT = 1
+
+
+class TrajectoryWriter:
+    """
+    Appends finished rounds to a store, creating it if needed
+    Pass it to Grass(players, store=writer) to store every round the table plays
+    Only one writer should append to a store at a time, parallel workers write stores of their own
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = os.path.join(path, "meta.json")
+        if not os.path.exists(meta):
+            with open(meta, "w") as f:
+                json.dump({"format": FORMAT, "record_fields": RECORD_FIELDS, "index_fields": INDEX_FIELDS,
+                           "action_codes": {ac.__name__: code for ac, code in ACTION_CODES.items()}}, f)
+        self.files = {name: open(os.path.join(path, name + ".bin"), "ab") for name in FILES}
+        # continue after the last complete round, left over bytes of an interrupted write are overwritten
+        index = TrajectoryStore(path).index
+        if len(index):
+            last = index[-1]
+            ends = {"records": (last[RECORD_START] + last[RECORDS]) * RECORD_FIELDS,
+                    "decks": last[DECK_START] + last[DECK_SIZE],
+                    "scores": last[SCORE_START] + last[PLAYERS],
+                    "index": len(index) * len(INDEX_FIELDS)}
+        else:
+            ends = dict.fromkeys(FILES, 0)
+        for name, f in self.files.items():
+            f.truncate(int(ends[name]) * np.dtype(FILES[name]).itemsize)
+        self.records = int(ends["records"]) // RECORD_FIELDS
+        self.decks = int(ends["decks"])
+        self.scores = int(ends["scores"])
+
+    def append(self, recording: Recording):
+        """ writes a finished round """
+        self.files["records"].write(recording.records.tobytes())
+        self.files["decks"].write(recording.deck)
+        self.files["scores"].write(array("d", recording.scores).tobytes())
+        for name in ("records", "decks", "scores"):
+            self.files[name].flush()
+        row = [self.records, len(recording), self.decks, len(recording.deck), self.scores, recording.players,
+               recording.start, recording.turns]
+        self.files["index"].write(array("q", row).tobytes())
+        self.files["index"].flush()
+        self.records += len(recording)
+        self.decks += len(recording.deck)
+        self.scores += recording.players
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_column(path: str, name: str, width: int = 1, rows: int = None) -> np.ndarray:
+    """ memory maps a raw file of the store read only, as rows of the width """
+    dtype = np.dtype(FILES[name])
+    filename = os.path.join(path, name + ".bin")
+    size = os.path.getsize(filename) // (dtype.itemsize * width) if os.path.exists(filename) else 0
+    if rows is not None:
+        size = min(size, rows)
+    if not size:
+        return np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+    shape = (size, width) if width > 1 else (size,)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=shape)
+
+
+class TrajectoryStore:
+    """
+    Read only view of a store, all columns are memory mapped numpy arrays
+    Rounds are given out as views into the mapped files, Recordings are only built when asked for
+    Reopen the store to see rounds written after it was opened
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = open_column(path, "index", len(INDEX_FIELDS))
+        if len(self.index):
+            last = self.index[-1]
+            self.records = open_column(path, "records", RECORD_FIELDS, int(last[RECORD_START] + last[RECORDS]))
+            self.decks = open_column(path, "decks", rows=int(last[DECK_START] + last[DECK_SIZE]))
+            self.scores = open_column(path, "scores", rows=int(last[SCORE_START] + last[PLAYERS]))
+        else:
+            self.records = open_column(path, "records", RECORD_FIELDS, 0)
+            self.decks = open_column(path, "decks", rows=0)
+            self.scores = open_column(path, "scores", rows=0)
+
+    def __len__(self):
+        return len(self.index)
+
+    def round_records(self, i: int) -> np.ndarray:
+        """ all action records of a round """
+        start, count = self.index[i, RECORD_START], self.index[i, RECORDS]
+        return self.records[start:start + count]
+
+    def round_deck(self, i: int) -> np.ndarray:
+        start, size = self.index[i, DECK_START], self.index[i, DECK_SIZE]
+        return self.decks[start:start + size]
+
+    def round_scores(self, i: int) -> np.ndarray:
+        start, size = self.index[i, SCORE_START], self.index[i, PLAYERS]
+        return self.scores[start:start + size]
+
+    def round_of(self, rows: np.ndarray) -> np.ndarray:
+        """ rounds of the given record rows """
+        return np.searchsorted(self.index[:, RECORD_START], rows, side="right") - 1
+
+    def recording(self, i: int) -> Recording:
+        """ a Recording of a stored round, to replay it with replay.Replayer """
+        return Recording.from_arrays(self.round_deck(i).tobytes(), self.round_records(i).tobytes(),
+                                     int(self.index[i, PLAYERS]), int(self.index[i, START_SEAT]),
+                                     self.round_scores(i).tolist(), int(self.index[i, TURNS]))
+
+    def sample_rounds(self, n: int, rng: np.random.Generator = None) -> np.ndarray:
+        """ indexes of n random rounds """
+        rng = rng or np.random.default_rng()
+        return rng.integers(0, len(self.index), n)
+
+    def sample_records(self, n: int, rng: np.random.Generator = None) -> tuple[np.ndarray, np.ndarray]:
+        """ n random action records, every action is equally likely, and the rounds they belong to """
+        rng = rng or np.random.default_rng()
+        rows = np.sort(rng.integers(0, len(self.records), n))
+        return self.records[rows], self.round_of(rows)
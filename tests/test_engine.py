@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from behaviour import Behaviour
+from engine import Agent, AsyncTable, BehaviourAgent, first_legal
+from grass import Grass
+from player import Player
+
+
+class Sender(Agent):
+    """ plays the first legal action and sends the same trade messages every turn """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+
+    async def act(self, observation: dict):
+        if observation["phase"] == "trade":
+            return self.messages
+        return first_legal(observation)
+
+
+class Slow(Behaviour):
+    def choose_play(self, player, game):
+        time.sleep(0.2)
+        return None
+
+
+def test_malformed_trade_messages_are_invalid():
+    game = Grass([Player(f"seat {i}", Behaviour()) for i in range(3)], seed=1)
+    messages = [{"offer": {"target": 1, "give": "zz", "take": "mo"}}, {"accept": [1]},
+                {"offer": {"target": 0, "give": "mo", "take": "mo"}}, {"reject": True}]
+    agents = [Sender(messages)] + [BehaviourAgent(game, seat, threaded=False) for seat in (1, 2)]
+    table = AsyncTable(game, agents)
+    asyncio.run(table.play_round())
+    assert game.status != "playing"
+    assert table.invalid[0] and table.invalid[0] % len(messages) == 0
+    assert table.invalid[1:] == [0, 0]
+
+
+def test_late_decision_keeps_its_seat_busy():
+    game = Grass([Player(f"seat {i}", Slow()) for i in range(2)], seed=1)
+    game.start_round()
+    agent = BehaviourAgent(game, 0)
+
+    async def decide():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(agent.act({"phase": "play"}), 0.01)
+        pending = agent.pending
+        # the first decision is still running, the next one is late right away
+        with pytest.raises(asyncio.TimeoutError):
+            await agent.act({"phase": "play"})
+        assert agent.pending is pending and not pending.done()
+        await pending
+        assert await agent.act({"phase": "play"}) is not None
+
+    asyncio.run(decide())
@@ -0,0 +1,35 @@
+import random
+
+from behaviour import Behaviour
+from grass import Grass
+from player import Player
+
+
+def streams(game: Grass) -> list:
+    """ the states of the streams of the table, the deck of large tables has its own reference """
+    return [rng.getstate() for rng in [game.rng, getattr(game.deck, "rng", game.rng)] + [pl.rng for pl in game.players]]
+
+
+def test_playing_a_clone_keeps_the_streams_of_the_table():
+    for large in (False, True):
+        game = Grass([Player(f"seat {i}", Behaviour()) for i in range(6)], large=large, seed=7)
+        game.start_round()
+        for turn in range(10):
+            game.play_turn()
+        before = streams(game)
+        table = game.clone()
+        while table.play_turn():
+            pass
+        assert streams(game) == before
+
+
+def test_clones_of_the_same_state_play_alike():
+    game = Grass([Player(f"seat {i}", Behaviour()) for i in range(6)], seed=7)
+    game.start_round()
+    tables = [game.clone(), game.clone()]
+    assert tables[0].rng is not game.rng
+    assert [pl.rng.random() for pl in tables[0].players] == [pl.rng.random() for pl in tables[1].players]
+    # a stream given to the clone is used for everything
+    rng = random.Random(1)
+    table = game.clone(rng)
+    assert table.rng is rng and all(pl.rng is rng for pl in table.players)
@@ -0,0 +1,29 @@
+import random
+
+from behaviour import SimpleMinded
+from grass import Grass
+from player import Player
+from replay import Replayer
+
+
+def zones(game: Grass) -> list:
+    """ every zone of the round card by card, in order """
+    piles = [game.deck, game.waste, game.aside]
+    for pl in game.players:
+        piles.extend((pl.hand, pl.stash, pl.hassle))
+    return [[c.kind for c in pile] for pile in piles] + [game.waste_status, [pl.skips for pl in game.players]]
+
+
+def test_seek_matches_a_straight_replay():
+    for seed in list(range(30)) + [115]:
+        game = Grass([Player(f"seat {i}", SimpleMinded()) for i in range(2 + seed % 5)], seed=seed, record=True,
+                     large=seed % 2 == 0)
+        game.play_round()
+        recording = game.recordings[-1]
+        seeking = Replayer(recording)
+        for turn in random.Random(seed).sample(range(game.turn + 1), min(8, game.turn)):
+            seeking.seek(turn)
+            straight = Replayer(recording)
+            while straight.position < len(recording) and recording.record(straight.position)[1] <= turn:
+                straight.step()
+            assert zones(seeking.game) == zones(straight.game), (seed, turn)
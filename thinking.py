@@ -1,4 +1,18 @@
-from player import Player
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from action import Action, DrawCard, PlayCard, ShowCard, PassCard, CardTrade
+from card import CARD_KINDS, CARDS
+from zone import TYPE_KINDS
+
+if TYPE_CHECKING:
+    from player import Player
+    from grass import Grass
+
+KINDS = len(CARD_KINDS)
 
 
 class Thinking:
@@ -11,7 +25,140 @@ class Thinking:
     whenever anything that influences them gets triggered
     In this sense, the Thinking component is always updated whenever a player
     moves themselves, or it is another players trading phase
+
+    Beliefs about hidden cards are only kept once the player watches a game (see watch):
+    - unseen: how many cards of every kind the player hasn't seen yet, in the deck or in other hands
+    - known: the expected number of cards of every kind, that the player knows to be in each of the other hands,
+      fractions come from cards passed on at random, of which the player only knows the chances
+    everything else in the other hands and the deck is assumed to be spread evenly over the unseen cards,
+    every observed action only changes a few entries, beliefs() puts the whole picture together when asked
     """
     def __init__(self, player: Player):
         self.player = player
-        self.concepts = {self.player.behaviour.believes}
+        self.concepts = dict(self.player.behaviour.believes)
+        self.seat = -1
+        self.unseen = np.zeros(KINDS)
+        self.known = np.zeros((0, KINDS))
+        self.waste_top = None
+
+    def watch(self, game: Grass):
+        """ starts observing every action of the game, from the next round on (or right away during one) """
+        game.observers.append(self)
+        if game.status == "playing":
+            self.start_round(game)
+
+    def start_round(self, game: Grass):
+        """ all the player has seen right after dealing is the own hand and the top of the waste pile """
+        self.seat = game.players.index(self.player)
+        self.unseen = np.bincount([c.kind for c in game.card_pool], minlength=KINDS).astype(np.float64)
+        self.known = np.zeros((len(game.players), KINDS))
+        for c in self.player.hand:
+            self.unseen[c.kind] -= 1
+        self.waste_top = game.waste.top()
+        if self.waste_top:
+            self.unseen[self.waste_top.kind] -= 1
+
+    def seen(self, seat: int, kind: int):
+        """ a card of the kind came out of the hand of the seat in the open """
+        if seat != self.seat:
+            self.known[seat, kind] = max(self.known[seat, kind] - 1, 0)
+            self.unseen[kind] -= 1
+
+    def likely_kind(self, seat: int, ctype: str) -> int:
+        """ the kind of a card of the type that the seat most likely holds """
+        kinds = TYPE_KINDS[ctype]
+        if len(kinds) == 1:
+            return kinds[0]
+        return max(kinds, key=lambda kind: (self.known[seat, kind], self.unseen[kind]))
+
+    def observe(self, game: Grass, action: Action):
+        """ takes in an action right after it took effect """
+        me = self.player
+        if isinstance(action, DrawCard):
+            if action.pile == "waste":
+                # the top of the waste pile was seen by everyone, now it is hidden in a hand we know of
+                if action.player is not me:
+                    self.known[game.players.index(action.player), self.waste_top.kind] += 1
+                    self.unseen[self.waste_top.kind] += 1
+            elif action.player is me:
+                self.unseen[me.hand[-1].kind] -= 1
+        elif isinstance(action, PlayCard):
+            seat = game.players.index(action.player)
+            card = CARDS.get((action.card_type, action.card_value))
+            self.seen(seat, card.kind if card else self.likely_kind(seat, action.card_type))
+        elif isinstance(action, ShowCard):
+            if action.player is not me:
+                # still in the hand, but now we know about it
+                seat = game.players.index(action.player)
+                kind = self.likely_kind(seat, action.card_type)
+                self.known[seat, kind] = max(self.known[seat, kind], 1)
+        elif isinstance(action, PassCard):
+            self.passed(game, action.player, action.target, action.card_type, action.card_value)
+        elif isinstance(action, CardTrade):
+            self.traded(game, action)
+        self.waste_top = game.waste.top()
+
+    def passed(self, game: Grass, giver: Player, receiver: Player, ctype: str, cvalue: int):
+        me = self.player
+        seat, target = game.players.index(giver), game.players.index(receiver)
+        if giver is me:
+            # we know what we passed, but it's out of sight now
+            card = CARDS.get((ctype, cvalue))
+            kind = card.kind if card else TYPE_KINDS[ctype][0]
+            self.known[target, kind] += 1
+            self.unseen[kind] += 1
+        elif receiver is me:
+            self.seen(seat, me.hand[-1].kind)
+        else:
+            # a random one of the givers cards, so every known card went on with its share of the chance
+            size = len(giver.hand) + 1
+            moved = self.known[seat] / size
+            self.known[seat] -= moved
+            self.known[target] += moved
+
+    def traded(self, game: Grass, action: CardTrade):
+        me = self.player
+        seat, target = game.players.index(action.player), game.players.index(action.target)
+        mine = self.likely_kind(seat, action.my_card_type)
+        yours = self.likely_kind(target, action.your_card_type)
+        if action.player is me or action.target is me:
+            # both sides of the trade know exactly which cards changed hands
+            mine, yours = (c.kind for c in action.cards)
+        if action.player is me:
+            self.seen(target, yours)
+            self.known[target, mine] += 1
+            self.unseen[mine] += 1
+        elif action.target is me:
+            self.seen(seat, mine)
+            self.known[seat, yours] += 1
+            self.unseen[yours] += 1
+        else:
+            # both cards were shown for the trade
+            for giver, taker, kind in ((seat, target, mine), (target, seat, yours)):
+                self.known[giver, kind] = max(self.known[giver, kind] - 1, 0)
+                self.known[taker, kind] += 1
+
+    def beliefs(self, game: Grass) -> np.ndarray:
+        """
+        expected number of cards of every kind in the hand of every seat (rows of seats) and in the deck (last row)
+        the own hand is exact
+        """
+        sizes = np.array([len(pl.hand) for pl in game.players] + [len(game.deck)], dtype=np.float64)
+        expected = np.zeros((len(game.players) + 1, KINDS))
+        expected[:-1] = self.known
+        expected[self.seat] = 0
+        free = np.maximum(self.unseen - expected[:-1].sum(axis=0), 0)
+        slots = np.maximum(sizes - expected.sum(axis=1), 0)
+        slots[self.seat] = 0
+        if free.sum():
+            expected += np.outer(slots, free / free.sum())
+        for c in self.player.hand:
+            expected[self.seat, c.kind] += 1
+        return expected
+
+    def chances(self, game: Grass, kind: int) -> np.ndarray:
+        """ the share of the unseen cards of the kind, that each seat (and the deck, last) is expected to hold """
+        expected = self.beliefs(game)[:, kind]
+        expected[self.seat] = 0
+        total = expected.sum()
+        return expected / total if total else expected
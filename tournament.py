@@ -0,0 +1,239 @@
+import argparse
+import ast
+import json
+import math
+import os
+import random
+import sys
+from itertools import combinations
+from multiprocessing import Pool
+from typing import Callable
+
+from runner import play_chunk, behaviour_factory, game_seed
+
+### Tournament:
+# ranks many Behaviour entries by self-play, spending games only where the order is still open
+# - every game seats a few entries at one table, its final scores count as a win, draw or loss
+#   for every pair of seated entries, so one game of n seats compares n * (n - 1) / 2 pairs at once
+# - ratings are Elo over those pairwise results, every pair of a game moves by K / (seats - 1)
+# - every pair of entries runs its own sequential probability ratio test on the pairwise results
+#   (the normal approximation used for engine testing, draws count half), with H0: the first entry scores
+#   0.5 - margin against the second and H1: 0.5 + margin, it stops once either one is accepted
+#   at the error rates alpha and beta, pairs closer than the margin end up either way
+# - games are planned in waves: every table starts with the undecided pair with the fewest results,
+#   the other seats go to the entries with the most undecided pairs among the seated entries,
+#   so decided matchups stop getting games and the close ones get them all
+# - seats are shuffled, and every table is seeded from the tournament seed and its game number,
+#   waves have a fixed size, not one per worker, so plans, results and stops don't depend on the number of workers
+UNDECIDED, FIRST, SECOND = 0, 1, -1
+WAVE = 32
+
+
+class Variant:
+    """
+    A picklable Behaviour factory with fixed arguments, e.g. Variant(ISMCTS, budget=0.02)
+    values replaces the concept values of the made behaviour (see behaviour.naive_eval)
+    """
+
+    def __init__(self, factory: Callable, name: str = None, values: dict = None, **kwargs):
+        self.factory = factory
+        self.values = values
+        self.kwargs = kwargs
+        settings = ",".join(f"{key}={value!r}" for key, value in kwargs.items())
+        self.name = name or getattr(factory, "__name__", str(factory)) + (f":{settings}" if settings else "")
+
+    def __call__(self):
+        made = self.factory(**self.kwargs)
+        if self.values is not None:
+            made.concept_values = self.values
+        return made
+
+    def __repr__(self):
+        return f"Variant({self.name})"
+
+
+class Matchup:
+    """ the pairwise results of two entries, from the view of the first one, and their sequential test """
+    __slots__ = ("games", "total", "squares", "decision")
+
+    def __init__(self):
+        self.games = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.decision = UNDECIDED
+
+    def add(self, result: float):
+        self.games += 1
+        self.total += result
+        self.squares += result * result
+
+    def mean(self) -> float:
+        return self.total / self.games if self.games else 0.5
+
+    def llr(self, margin: float) -> float:
+        """ log likelihood ratio of H1 (scoring 0.5 + margin) against H0 (scoring 0.5 - margin) """
+        if not self.games:
+            return 0.0
+        mean = self.mean()
+        variance = self.squares / self.games - mean * mean
+        if variance <= 0:
+            # all results equal so far, which carries as much evidence as the smallest spread of results
+            variance = 0.25 / self.games
+        s0, s1 = 0.5 - margin, 0.5 + margin
+        return self.games * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+class Tournament:
+    """
+    Self-play tournament of Behaviour entries (classes, Variants or any picklable factories) on tables of seats,
+    playing until every pair of entries is decided or the budget of games is spent
+    """
+
+    def __init__(self, entries: list, seats: int = 4, rounds: int = 1, margin: float = 0.05,
+                 alpha: float = 0.05, beta: float = 0.05, min_games: int = 20, k: float = 24, seed: int = None):
+        if len(entries) < 2:
+            raise ValueError("a tournament needs at least two entries")
+        if seats < 2:
+            raise ValueError("Grass needs at least two players")
+        self.entries = list(entries)
+        self.names = [getattr(entry, "name", None) or getattr(entry, "__name__", str(entry)) for entry in entries]
+        self.seats = min(seats, len(entries))
+        self.rounds = rounds
+        self.margin = margin
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.min_games = min_games
+        self.k = k
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.games = 0
+        self.ratings = [1500.0] * len(entries)
+        self.played = [0] * len(entries)
+        self.matchups = {pair: Matchup() for pair in combinations(range(len(entries)), 2)}
+
+    def undecided(self) -> list[tuple[int, int]]:
+        return [pair for pair, matchup in self.matchups.items() if matchup.decision == UNDECIDED]
+
+    def plan(self, tables: int) -> list[list[int]]:
+        """ seatings of the next tables, as entry indexes in seat order """
+        open_pairs = self.undecided()
+        if not open_pairs:
+            return []
+        planned = {pair: self.matchups[pair].games for pair in open_pairs}
+        seatings = []
+        for t in range(tables):
+            first = min(open_pairs, key=lambda pair: (planned[pair], self.rng.random()))
+            seated = list(first)
+            while len(seated) < self.seats:
+                candidates = [entry for entry in range(len(self.entries)) if entry not in seated]
+                seated.append(max(candidates, key=lambda entry: (
+                    sum(tuple(sorted((entry, other))) in planned for other in seated), self.rng.random())))
+            for pair in combinations(sorted(seated), 2):
+                if pair in planned:
+                    planned[pair] += 1
+            self.rng.shuffle(seated)
+            seatings.append(seated)
+        return seatings
+
+    def task(self, seating: list[int]) -> tuple:
+        seed = None if self.seed is None else game_seed(self.seed, self.games)
+        self.games += 1
+        return [self.entries[entry] for entry in seating], 1, self.rounds, seed, False
+
+    def add_game(self, seating: list[int], scores: list[float]):
+        """ takes in the final scores of a table, updating ratings and the tests of all seated pairs """
+        results = {}
+        for (a, score_a), (b, score_b) in combinations(zip(seating, scores), 2):
+            if a > b:
+                a, b, score_a, score_b = b, a, score_b, score_a
+            results[a, b] = 1.0 if score_a > score_b else 0.5 if score_a == score_b else 0.0
+        step = self.k / (len(seating) - 1)
+        change = [0.0] * len(self.entries)
+        for (a, b), result in results.items():
+            expected = 1 / (1 + 10 ** ((self.ratings[b] - self.ratings[a]) / 400))
+            change[a] += step * (result - expected)
+            change[b] -= step * (result - expected)
+            matchup = self.matchups[a, b]
+            matchup.add(result)
+            if matchup.decision == UNDECIDED and matchup.games >= self.min_games:
+                llr = matchup.llr(self.margin)
+                if llr >= self.upper:
+                    matchup.decision = FIRST
+                elif llr <= self.lower:
+                    matchup.decision = SECOND
+        for entry in seating:
+            self.played[entry] += 1
+            self.ratings[entry] += change[entry]
+
+    def run(self, max_games: int = 10000, workers: int = None, wave: int = None) -> dict:
+        """
+        plays waves of tables until every pair is decided or max_games were played,
+        the plan is only updated between waves, of WAVE tables unless given
+        """
+        workers = workers or os.cpu_count() or 1
+        wave = wave or WAVE
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            while self.games < max_games:
+                seatings = self.plan(min(wave, max_games - self.games))
+                if not seatings:
+                    break
+                tasks = [self.task(seating) for seating in seatings]
+                results = pool.imap(play_chunk, tasks) if pool else map(play_chunk, tasks)
+                for seating, result in zip(seatings, results):
+                    self.add_game(seating, result.scores)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return self.standings()
+
+    def standings(self) -> dict:
+        order = sorted(range(len(self.entries)), key=lambda entry: -self.ratings[entry])
+        pairs = {}
+        for (a, b), matchup in self.matchups.items():
+            winner = {FIRST: self.names[a], SECOND: self.names[b]}.get(matchup.decision)
+            pairs[f"{self.names[a]} vs {self.names[b]}"] = {"games": matchup.games, "score": matchup.mean(),
+                                                            "decided": winner}
+        return {
+            "games": self.games,
+            "decided": len(self.matchups) - len(self.undecided()),
+            "pairs": len(self.matchups),
+            "ranking": [{"name": self.names[entry], "rating": round(self.ratings[entry], 1),
+                         "games": self.played[entry]} for entry in order],
+            "matchups": pairs,
+        }
+
+
+def parse_entry(text: str) -> Variant:
+    """ an entry as 'Name' or 'Name:key=value,key=value', values are python literals """
+    name, _, settings = text.partition(":")
+    kwargs = {}
+    for setting in filter(None, settings.split(",")):
+        key, _, value = setting.partition("=")
+        kwargs[key.strip()] = ast.literal_eval(value.strip())
+    return Variant(behaviour_factory(name), **kwargs)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rank Behaviours by self-play with sequential stopping")
+    parser.add_argument("entries", nargs="+", help="behaviour names, with arguments as Name:key=value,...")
+    parser.add_argument("--seats", type=int, default=4, help="seats per table")
+    parser.add_argument("--rounds", type=int, default=1, help="rounds played on every table")
+    parser.add_argument("--max-games", type=int, default=10000)
+    parser.add_argument("--margin", type=float, default=0.05, help="pairwise scores closer to 0.5 count as even")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--min-games", type=int, default=20, help="pairwise results before a pair can be decided")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to all cores")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    tournament = Tournament([parse_entry(entry) for entry in args.entries], args.seats, args.rounds, args.margin,
+                            args.alpha, args.beta, args.min_games, seed=args.seed)
+    print(json.dumps(tournament.run(args.max_games, args.workers), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import random
+from bisect import insort
+from typing import TYPE_CHECKING
+
+from card import Card, CARD_KINDS, CARDS
+
+if TYPE_CHECKING:
+    from locations import CardLocations
+
+# card kinds of every card type, e.g. the 4 kinds of peddle
+TYPE_KINDS = {}
+for c in CARD_KINDS:
+    TYPE_KINDS.setdefault(c.type, []).append(c.kind)
+
+# the Random instance behind the functions of the random module, the stream of everything that isn't seeded
+# unlike the module itself it can be copied and pickled, copies go on with a copy of the stream
+# random._inst is private to CPython, where it is missing, unseeded tables get a stream of their own,
+# which random.seed() doesn't reach
+SHARED_RANDOM = getattr(random, "_inst", None) or random.Random()
+
+
+class Zone:
+    """
+    A pile of cards in front of or in the hand of a player, like the hand, the stash or the hassle pile
+    It behaves like a list of cards, but also keeps count of its cards by kind, the positions of every kind,
+    the sorted distinct peddle values and the summed up card values per card type, so all lookups are O(1)
+    Order only matters for the top of a pile (the end), taking a card out of the middle moves the
+    last card into its place
+    """
+
+    def __init__(self, cards=()):
+        self.cards = []
+        # optional table wide index of which zones hold any of some kinds, see track()
+        self.tracked = None
+        self.holders = None
+        self.owner = -1
+        self.held = 0
+        # optional index of where all cards of the table are, see locations.py
+        self.locations = None
+        self.zone = -1
+        # counts every change of the cards, a copy starts out with the version of the zone it copies,
+        # so the same zone object at the same version always holds the same cards
+        self.version = 0
+        self.clear()
+        self.extend(cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __bool__(self):
+        return bool(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __getitem__(self, item):
+        return self.cards[item]
+
+    def __repr__(self):
+        return f"Zone({self.cards!r})"
+
+    def _added(self, card: Card):
+        self.version += 1
+        self.counts[card.kind] += 1
+        self.totals[card.type] += card.value
+        if card.type == "pd" and self.counts[card.kind] == 1:
+            insort(self.peddle_values, card.value)
+        if self.locations is not None:
+            self.locations.added(self.zone, card.kind)
+        if self.tracked is not None and card.kind in self.tracked:
+            self.held += 1
+            if self.held == 1:
+                self.holders.add(self.owner)
+
+    def _removed(self, card: Card):
+        self.version += 1
+        self.counts[card.kind] -= 1
+        self.totals[card.type] -= card.value
+        if card.type == "pd" and not self.counts[card.kind]:
+            self.peddle_values.remove(card.value)
+        if self.locations is not None:
+            self.locations.removed(self.zone, card.kind)
+        if self.tracked is not None and card.kind in self.tracked:
+            self.held -= 1
+            if not self.held:
+                self.holders.discard(self.owner)
+
+    def locate(self, locations: CardLocations, zone: int):
+        """ reports every change of the zone to the card locations of the table """
+        self.locations = locations
+        self.zone = zone
+        for kind, count in enumerate(self.counts):
+            if count:
+                locations.added(zone, kind, count)
+
+    def track(self, kinds, holders: set, owner: int):
+        """ keeps the owner in the holders set, as long as the zone holds any card of the kinds """
+        self.tracked = frozenset(kinds)
+        self.holders = holders
+        self.owner = owner
+        self.held = sum(self.counts[kind] for kind in self.tracked)
+        if self.held:
+            holders.add(owner)
+        else:
+            holders.discard(owner)
+
+    def append(self, card: Card):
+        self.positions[card.kind].add(len(self.cards))
+        self.cards.append(card)
+        self._added(card)
+
+    def extend(self, cards):
+        for card in cards:
+            self.append(card)
+
+    def pop(self, index: int = -1) -> Card:
+        """ takes the card at the index, the last card fills the gap """
+        if index < 0:
+            index += len(self.cards)
+        card = self.cards[index]
+        last = len(self.cards) - 1
+        self.positions[card.kind].remove(index)
+        if index != last:
+            moved = self.cards[last]
+            self.positions[moved.kind].remove(last)
+            self.positions[moved.kind].add(index)
+            self.cards[index] = moved
+        self.cards.pop()
+        self._removed(card)
+        return card
+
+    def copy(self) -> Zone:
+        """ an independent zone with the same cards, the cards themselves are shared """
+        zone = Zone.__new__(Zone)
+        zone.tracked = None
+        zone.holders = None
+        zone.owner = -1
+        zone.held = 0
+        zone.locations = None
+        zone.zone = -1
+        zone.version = self.version
+        zone.cards = self.cards.copy()
+        zone.counts = self.counts.copy()
+        zone.positions = list(map(set.copy, self.positions))
+        zone.totals = self.totals.copy()
+        zone.peddle_values = self.peddle_values.copy()
+        return zone
+
+    def clear(self):
+        if self.held:
+            self.held = 0
+            self.holders.discard(self.owner)
+        if self.locations is not None:
+            for kind, count in enumerate(self.counts):
+                if count:
+                    self.locations.removed(self.zone, kind, count)
+        self.version += 1
+        self.cards.clear()
+        self.counts = [0] * len(CARD_KINDS)
+        self.positions = [set() for c in CARD_KINDS]
+        self.totals = dict.fromkeys(TYPE_KINDS, 0)
+        self.peddle_values = []
+
+    def top(self) -> Card:
+        if self.cards:
+            return self.cards[-1]
+
+    def find_kind(self, ctype: str, cvalue: int = 0) -> int:
+        """ kind of a held card of the type (and value, if given), else -1 """
+        if cvalue:
+            kind = CARDS.get((ctype, cvalue))
+            if kind and self.counts[kind.kind]:
+                return kind.kind
+            return -1
+        for kind in TYPE_KINDS.get(ctype, ()):
+            if self.counts[kind]:
+                return kind
+        return -1
+
+    def find(self, ctype: str, cvalue: int = 0) -> Card:
+        """ a held card of the type (and value, if given) """
+        kind = self.find_kind(ctype, cvalue)
+        if kind >= 0:
+            return CARD_KINDS[kind]
+
+    def take(self, ctype: str, cvalue: int = 0) -> Card:
+        """
+        take a card of the type (and value, if given) out of the zone, always the first one of its kind,
+        so the order of the zone only depends on its cards, not on how its positions were filled
+        """
+        kind = self.find_kind(ctype, cvalue)
+        if kind >= 0:
+            return self.pop(min(self.positions[kind]))
+
+    def count(self, ctype: str, cvalue: int = 0) -> int:
+        if cvalue:
+            kind = CARDS.get((ctype, cvalue))
+            return self.counts[kind.kind] if kind else 0
+        return sum(self.counts[kind] for kind in TYPE_KINDS.get(ctype, ()))
+
+    def peddle_counts(self) -> tuple[int, ...]:
+        """ counts of the held peddle cards per denomination, from low to high """
+        return tuple(self.counts[kind] for kind in TYPE_KINDS["pd"])
+
+    def total(self, *ctypes: str) -> int:
+        """ summed up values of all held cards of the types """
+        return sum(self.totals[ctype] for ctype in ctypes)
+
+    def lowest_peddle(self) -> int:
+        """ lowest held peddle value, else 0 """
+        return self.peddle_values[0] if self.peddle_values else 0
+
+    def highest_peddle(self) -> int:
+        """ highest held peddle value, else 0 """
+        return self.peddle_values[-1] if self.peddle_values else 0
+
+
+class Pile:
+    """
+    A face down pile like the deck, which is only ever drawn from the top (the end)
+    Copies share the list of cards and only remember how many of them are left, drawing never changes the list,
+    so a copy is O(1) and the cards are only copied once a copy puts a card back onto a shared pile
+    """
+    __slots__ = ("cards", "size")
+
+    def __init__(self, cards=()):
+        self.cards = list(cards)
+        self.size = len(self.cards)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __iter__(self):
+        return iter(self.cards[:self.size])
+
+    def __getitem__(self, item):
+        return self.cards[:self.size][item]
+
+    def __repr__(self):
+        return f"Pile({self.cards[:self.size]!r})"
+
+    def pop(self) -> Card:
+        if not self.size:
+            raise IndexError("pop from empty pile")
+        self.size -= 1
+        return self.cards[self.size]
+
+    def append(self, card: Card):
+        # other copies might still see cards beyond our top, those must stay untouched
+        if self.size < len(self.cards):
+            self.cards = self.cards[:self.size]
+        self.cards.append(card)
+        self.size += 1
+
+    def copy(self) -> Pile:
+        pile = Pile.__new__(Pile)
+        pile.cards = self.cards
+        pile.size = self.size
+        return pile
+
+
+class LazyPile(Pile):
+    """
+    A pile that is shuffled while drawing: every draw swaps a random one of the cards left to the top
+    (Fisher-Yates, one step at a time), so a round that ends early never pays for shuffling the whole pile
+    As drawing changes the list, copies don't share it, the random stream is shared though
+    """
+    __slots__ = ("rng",)
+
+    def __init__(self, cards=(), rng: random.Random = SHARED_RANDOM):
+        super().__init__(cards)
+        self.rng = rng
+
+    def pop(self) -> Card:
+        if not self.size:
+            raise IndexError("pop from empty pile")
+        cards = self.cards
+        last = self.size - 1
+        i = self.rng.randint(0, last)
+        cards[i], cards[last] = cards[last], cards[i]
+        self.size = last
+        return cards[last]
+
+    def copy(self) -> LazyPile:
+        pile = LazyPile.__new__(LazyPile)
+        pile.cards = self.cards[:self.size]
+        pile.size = self.size
+        pile.rng = self.rng
+        return pile